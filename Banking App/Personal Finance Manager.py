@@ -1,15 +1,42 @@
-from datetime import datetime  # Extracts current date and time
-import uuid  # Generates unique user IDs
-import bcrypt #  Hashes passwords
+from datetime import datetime, timedelta  # Extracts current date and time
+from array import array  # Typed columns for compact transaction storage
+import calendar  # Month lengths for monthly balance series
+from bisect import bisect_left, bisect_right  # Binary search over the per-account date index
+from collections import OrderedDict  # LRU ordering for the session table
+from concurrent.futures import ThreadPoolExecutor  # Runs bcrypt off the calling thread
+import asyncio  # Async variants of login/registration
+import os  # CPU count for sizing the hashing pool
+import secrets  # Generates session tokens
+import threading  # Bounds the number of queued hashing jobs and guards accounts shared between threads
+import time  # Session expiry
+import uuid  # Rebuilds ids stored as bytes
+from ids import new_id, new_ids, new_ids_bytes  # Time-ordered unique ids for accounts and transactions
+from indexes import TransactionIndex  # Optional cross-account secondary indexes
 from utility import UserAlreadyExistsError, AuthenticationError, InvalidTransactionError, InsufficientFundsError, \
-    UnauthorizedError, hash_password
+    UnauthorizedError, hash_password, check_password, DEFAULT_BCRYPT_ROUNDS, format_minor_units, \
+    percent_of_minor_units, lock_order
 
 
 # Defining a class named "AuthenticationService" which functions have been initiated to handle user authentication
 # including registration, login, and logout
 class AuthenticationService:
-    def __init__(self):
-        self.users = {}  # Key: username, Value: User
+    # rounds is the bcrypt work factor. Hashing for the pooled/async methods runs on up to max_workers threads
+    # (bcrypt releases the GIL while hashing) and at most max_pending jobs may be queued or running at once;
+    # beyond that, submitting blocks until a slot frees up. max_sessions and session_ttl (seconds) bound the
+    # session table that lets a client authenticate with a token instead of its password. If a ledger.Ledger is
+    # given, registered users are journalled to it. users can be a users.UserDirectory to keep users on disk
+    # instead of in a dict.
+    def __init__(self, rounds=DEFAULT_BCRYPT_ROUNDS, max_workers=None, max_pending=None, max_sessions=100000,
+                 session_ttl=30 * 60, ledger=None, users=None):
+        self.users = users if users is not None else {}  # Key: username, Value: User
+        self.ledger = ledger
+        self.sessions = SessionStore(max_sessions, session_ttl)
+        self.rounds = rounds
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._pending = threading.BoundedSemaphore(max_pending or self.max_workers * 4)
+        self._executor = None  # Created on first use
+        self._executor_lock = threading.Lock()  # Makes sure only one pool is ever created
+        self._users_lock = threading.RLock()  # Held while users are added or read for a ledger snapshot
 
     # Registers new user and adds to user dictionary
     def register_user(self, username, password):
@@ -17,22 +44,127 @@ class AuthenticationService:
             # Imported from utility, raising an exception if user exists already
             raise UserAlreadyExistsError(f"Username '{username}' already exists")
         # Hashing password before storing it for security
-        hashed_password = hash_password(password)
-        self.users[username] = User(username, hashed_password)
+        hashed_password = hash_password(password, self.rounds)
+        self._add_user(User(username, hashed_password))
+
+    # Puts a new user in the dictionary, recording it in the ledger if there is one
+    def _add_user(self, user):
+        with self._users_lock:
+            self.users[user.username] = user
+        if self.ledger is not None:
+            self.ledger.record_user(user)
+
+    # Re-creates a user loaded from the ledger on startup. Users already present (e.g. kept on disk by a
+    # users.UserDirectory) are left as they are.
+    def restore_user(self, username, password_hash):
+        with self._users_lock:
+            if username not in self.users:
+                self.users[username] = User(username, password_hash)
+
+    # (username, password hash) of every user, read while no user can be added, e.g. for a ledger snapshot
+    def user_records(self):
+        with self._users_lock:
+            return [(user.username, user.password_hash) for user in self.users.values()]
 
     # Defining login function for authenticating the user by checking username & password, then authenticate (if correct).
     def login(self, username, password):
         user = self.users.get(username)
-        if not user or not bcrypt.checkpw(password.encode(), user.password_hash):
+        if not user or not check_password(password, user.password_hash):
             raise AuthenticationError("Invalid username or password")
         user.is_authenticated = True
         return True
 
-    # Defining log out function if the authentication function is False.
+    # Defining log out function if the authentication function is False. Also ends any sessions the user holds.
     def logout(self, username):
         user = self.users.get(username)
         if user:
             user.is_authenticated = False
+        self.sessions.revoke_user(username)
+
+    # Logs in with username & password like login, then issues a session token. Later calls present the token
+    # to validate_session instead of paying for another bcrypt check.
+    def login_with_token(self, username, password):
+        self.login(username, password)
+        return self.sessions.issue(username)
+
+    # Returns the User owning a live session token, or raises AuthenticationError if it is unknown or expired
+    def validate_session(self, token):
+        username = self.sessions.get(token)
+        user = self.users.get(username) if username is not None else None
+        if user is None:
+            raise AuthenticationError("Invalid or expired session")
+        return user
+
+    # Ends a single session
+    def end_session(self, token):
+        self.sessions.revoke(token)
+
+    # Submits a bcrypt job to the hashing pool, blocking while the pool is saturated. Returns a Future.
+    def _submit(self, function, *args):
+        executor = self._executor
+        if executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='bcrypt')
+                executor = self._executor
+        self._pending.acquire()
+        try:
+            future = executor.submit(function, *args)
+        except BaseException:
+            self._pending.release()
+            raise
+        future.add_done_callback(lambda _: self._pending.release())
+        return future
+
+    # Submits the password check for a login to the hashing pool and returns a Future that resolves to True,
+    # or raises AuthenticationError, once the check has run.
+    def submit_login(self, username, password):
+        return self._submit(self.login, username, password)
+
+    # Registers many users at once, hashing their passwords in parallel on the pool. credentials is an iterable of
+    # (username, password) pairs. Nothing is registered if any username is already taken or repeated.
+    def register_users_bulk(self, credentials):
+        credentials = list(credentials)
+        seen = set()
+        for username, _ in credentials:
+            if username in self.users or username in seen:
+                raise UserAlreadyExistsError(f"Username '{username}' already exists")
+            seen.add(username)
+        futures = [(username, self._submit(hash_password, password, self.rounds)) for username, password in credentials]
+        new_users = {username: User(username, future.result()) for username, future in futures}
+        # One bulk write, which a UserDirectory does in a single transaction
+        with self._users_lock:
+            self.users.update(new_users)
+        if self.ledger is not None:
+            for user in new_users.values():
+                self.ledger.record_user(user)
+
+    # Async version of login for use from an event loop; the bcrypt check runs on the hashing pool
+    async def login_async(self, username, password):
+        return await self._run_async(self.login, username, password)
+
+    # Async version of register_user; the hashing runs on the hashing pool
+    async def register_user_async(self, username, password):
+        if username in self.users:
+            raise UserAlreadyExistsError(f"Username '{username}' already exists")
+        hashed_password = await self._run_async(hash_password, password, self.rounds)
+        # Checked again in case the same name was registered while hashing
+        if username in self.users:
+            raise UserAlreadyExistsError(f"Username '{username}' already exists")
+        self._add_user(User(username, hashed_password))
+
+    async def _run_async(self, function, *args):
+        # Waiting for a free slot happens off the event loop so a saturated pool doesn't stall it
+        loop = asyncio.get_running_loop()
+        future = await loop.run_in_executor(None, self._submit, function, *args)
+        return await asyncio.wrap_future(future)
+
+    # Shuts down the hashing pool, waiting for queued jobs to finish
+    def close(self):
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
 
 
 # Basic user class with username, hashed password and authentication status
@@ -43,156 +175,810 @@ class User:
         self.is_authenticated = False
 
 
+# Bounded session table mapping token -> username. Entries expire ttl seconds after they were last used and the
+# least recently used entry is evicted once max_size is reached, so every operation is O(1).
+class SessionStore:
+    def __init__(self, max_size=100000, ttl=30 * 60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._sessions = OrderedDict()  # Key: token, Value: (username, expiry), least recently used first
+        self._user_tokens = {}  # Key: username, Value: set of tokens
+        self._lock = threading.Lock()
+
+    # Creates a new session for username and returns its token
+    def issue(self, username):
+        token = secrets.token_urlsafe(32)
+        with self._lock:
+            while len(self._sessions) >= self.max_size:
+                old_token, (old_username, _) = self._sessions.popitem(last=False)
+                self._forget(old_token, old_username)
+            self._sessions[token] = (username, time.monotonic() + self.ttl)
+            self._user_tokens.setdefault(username, set()).add(token)
+        return token
+
+    # Returns the username for a live token (refreshing its expiry), or None
+    def get(self, token):
+        with self._lock:
+            entry = self._sessions.get(token)
+            if entry is None:
+                return None
+            username, expiry = entry
+            now = time.monotonic()
+            if expiry < now:
+                del self._sessions[token]
+                self._forget(token, username)
+                return None
+            self._sessions[token] = (username, now + self.ttl)
+            self._sessions.move_to_end(token)
+            return username
+
+    def revoke(self, token):
+        with self._lock:
+            entry = self._sessions.pop(token, None)
+            if entry is not None:
+                self._forget(token, entry[0])
+
+    def revoke_user(self, username):
+        with self._lock:
+            for token in self._user_tokens.pop(username, ()):
+                self._sessions.pop(token, None)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _forget(self, token, username):
+        tokens = self._user_tokens.get(username)
+        if tokens is not None:
+            tokens.discard(token)
+            if not tokens:
+                del self._user_tokens[username]
+
+
+# Transaction dates are stored as whole microseconds since this (naive) epoch
+EPOCH = datetime(1970, 1, 1)
+ONE_MICROSECOND = timedelta(microseconds=1)
+MAX_TYPE_CODE = 255  # Largest code the one byte types column can hold
+ITER_PAGE_SIZE = 1000  # Transactions copied at a time by TransactionManager.iter_transactions_for_account
+
+
+def to_timestamp(date):
+    return (date - EPOCH) // ONE_MICROSECOND
+
+
+def from_timestamp(timestamp):
+    return EPOCH + timedelta(microseconds=timestamp)
+
+
+# Compact, column-per-field storage for one account's transactions, kept in date order. Each transaction takes
+# 41 bytes (8 timestamp + 8 amount + 8 balance + 1 type code + 16 id, and 8 more for the running total once
+# balance_as_of has been used) plus the arrays' spare capacity, against roughly 450 bytes for the equivalent dict with
+# its UUID and datetime objects. It behaves like a read-only list of transaction dicts: indexing, slicing and
+# iterating build the dicts on demand. With minor_units the amounts, balances and running totals are int64 minor
+# units (cents) instead of floats, so sums stay exact.
+class TransactionColumns:
+    # Transaction types are stored as a one byte code into this table, which is shared by every account
+    type_names = []
+    type_codes = {}
+    type_codes_lock = threading.Lock()  # Held while a new type is added
+
+    def __init__(self, account_id, minor_units=False):
+        self.account_id = account_id
+        self.minor_units = minor_units
+        money_type = 'q' if minor_units else 'd'
+        self.timestamps = array('q')  # Microseconds since EPOCH, sorted
+        self.amounts = array(money_type)
+        self.balances = array(money_type)
+        self.types = array('B')
+        self.ids = bytearray()  # 16 bytes per transaction
+        # Running totals of amounts in date order: prefix_sums[i] = amounts[0] + ... + amounts[i]. Built lazily by
+        # net_change_until and only valid for the first len(prefix_sums) transactions; a back-dated insert cuts it
+        # back to the insert position.
+        self.prefix_sums = array(money_type)
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._transaction(position) for position in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("transaction index out of range")
+        return self._transaction(index)
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self._transaction(position)
+
+    # timestamp can be passed when the caller has already worked it out from the transaction's date
+    def append(self, transaction, timestamp=None):
+        type_code = self.type_code(transaction['type'])  # First, so an unknown type can't leave a partial row
+        self.timestamps.append(to_timestamp(transaction['date']) if timestamp is None else timestamp)
+        self.amounts.append(transaction['amount'])
+        self.balances.append(transaction['balance'])
+        self.types.append(type_code)
+        self.ids += transaction['id'].bytes
+
+    def insert(self, position, transaction, timestamp=None):
+        type_code = self.type_code(transaction['type'])
+        self.timestamps.insert(position, to_timestamp(transaction['date']) if timestamp is None else timestamp)
+        self.amounts.insert(position, transaction['amount'])
+        self.balances.insert(position, transaction['balance'])
+        self.types.insert(position, type_code)
+        self.ids[16 * position:16 * position] = transaction['id'].bytes
+        del self.prefix_sums[position:]
+
+    def extend(self, transactions):
+        for transaction in transactions:
+            self.append(transaction)
+
+    # New TransactionColumns holding postings ((amount, type, balance after) tuples) that share one timestamp, with
+    # id_bytes holding their ids 16 bytes each. The columns are built straight from the tuples, no dict per row.
+    @staticmethod
+    def from_postings(account_id, minor_units, timestamp, id_bytes, postings):
+        block = TransactionColumns(account_id, minor_units)
+        if not postings:
+            return block
+        money_type = block.amounts.typecode
+        amounts, types, balances = zip(*postings)
+        type_code = TransactionColumns.type_code
+        block.types = array('B', [type_code(type) for type in types])
+        block.amounts = array(money_type, amounts)
+        block.balances = array(money_type, balances)
+        block.timestamps = array('q', [timestamp]) * len(postings)
+        block.ids = bytearray(id_bytes)
+        return block
+
+    # Appends all of another TransactionColumns' rows, column by column. Only valid when they are already in date
+    # order and none is dated before this one's last transaction.
+    def extend_columns(self, other):
+        self.timestamps.extend(other.timestamps)
+        self.amounts.extend(other.amounts)
+        self.balances.extend(other.balances)
+        self.types.extend(other.types)
+        self.ids += other.ids
+
+    # Copy of the rows from first up to (not including) last as a new TransactionColumns
+    def slice(self, first, last):
+        block = TransactionColumns(self.account_id, self.minor_units)
+        block.timestamps = self.timestamps[first:last]
+        block.amounts = self.amounts[first:last]
+        block.balances = self.balances[first:last]
+        block.types = self.types[first:last]
+        block.ids = self.ids[16 * first:16 * last]
+        return block
+
+    # Whether the rows can be appended with extend_columns after this one's
+    def can_extend_with(self, other):
+        if not other:
+            return True
+        timestamps = other.timestamps
+        if self and self.timestamps[-1] > timestamps[0]:
+            return False
+        return all(timestamps[i] <= timestamps[i + 1] for i in range(len(timestamps) - 1))
+
+    # Sum of the amounts of all transactions up to and including date, in O(log n) once the running totals have
+    # caught up with the latest inserts
+    def net_change_until(self, date):
+        count = bisect_right(self.timestamps, to_timestamp(date))
+        if count == 0:
+            return 0
+        prefix_sums = self.prefix_sums
+        if len(prefix_sums) < count:
+            total = prefix_sums[-1] if prefix_sums else 0
+            for amount in self.amounts[len(prefix_sums):count]:
+                total += amount
+                prefix_sums.append(total)
+        return prefix_sums[count - 1]
+
+    # The transaction with the given timestamp and id bytes, found by binary search on the timestamp
+    def find(self, timestamp, id_bytes):
+        position = bisect_left(self.timestamps, timestamp)
+        while position < len(self) and self.timestamps[position] == timestamp:
+            if self.ids[16 * position:16 * position + 16] == id_bytes:
+                return self._transaction(position)
+            position += 1
+        return None
+
+    # Position just after the transaction with the given timestamp and id bytes, or of the first transaction after
+    # timestamp if it is no longer there
+    def position_after(self, timestamp, id_bytes):
+        position = bisect_left(self.timestamps, timestamp)
+        while position < len(self) and self.timestamps[position] == timestamp:
+            if self.ids[16 * position:16 * position + 16] == id_bytes:
+                return position + 1
+            position += 1
+        return position
+
+    # Bytes used by the columns, including spare capacity
+    def nbytes(self):
+        return sum(column.buffer_info()[1] * column.itemsize
+                   for column in (self.timestamps, self.amounts, self.balances, self.types, self.prefix_sums)
+                   ) + len(self.ids)
+
+    def _transaction(self, position):
+        return {
+            'id': uuid.UUID(bytes=bytes(self.ids[16 * position:16 * position + 16])),
+            'date': from_timestamp(self.timestamps[position]),
+            'type': TransactionColumns.type_names[self.types[position]],
+            'amount': self.amounts[position],
+            'account_id': self.account_id,
+            'balance': self.balances[position]
+        }
+
+    # Code of a transaction type in the types column, allocating a new one the first time a type is seen
+    @staticmethod
+    def type_code(type):
+        code = TransactionColumns.type_codes.get(type)
+        if code is None:
+            with TransactionColumns.type_codes_lock:
+                code = TransactionColumns.type_codes.get(type)
+                if code is None:
+                    code = len(TransactionColumns.type_names)
+                    if code > MAX_TYPE_CODE:
+                        raise InvalidTransactionError(f"Too many transaction types, cannot add '{type}' "
+                                                      f"(at most {MAX_TYPE_CODE + 1})")
+                    TransactionColumns.type_names.append(type)
+                    TransactionColumns.type_codes[type] = code
+        return code
+
+
 # Define the class to manage the transactions and retrieve based on date
 class TransactionManager:
-    def __init__(self):
-        # Stores transactions for each account
-        self.transactions = {}  # Key: account_id, Value: list of transactions
+    columns_class = TransactionColumns  # Type of the per-account columns, e.g. for history_io and ledger snapshots
+
+    # If a ledger.Ledger is given, every new transaction is journalled to it. With minor_units=True all amounts
+    # and balances are whole minor units (ints, e.g. cents): the accounts using this manager and their budgets
+    # only accept ints, and everything is stored and summed exactly as int64. With indexes=True every transaction
+    # is also added to cross-account secondary indexes (by type, amount and time) used by find_transactions.
+    def __init__(self, ledger=None, minor_units=False, indexes=False):
+        self.ledger = ledger
+        self.minor_units = minor_units
+        self.index = TransactionIndex(minor_units) if indexes else None
+        # Stores transactions for each account in date order, as compact columns
+        self.transactions = {}  # Key: account_id, Value: TransactionColumns
+        # One lock per account so threads posting to different accounts don't wait on each other
+        self._locks = {}  # Key: account_id, Value: RLock
+        self._locks_lock = threading.Lock()  # Only held while creating an account's lock
 
-    # Adding new transaction to the account's transaction list
-    def add_transaction(self, account_id, amount, type, current_balance):
+    # Adding new transaction to the account's transaction list. A back-dated posting can pass its own date and is
+    # slotted into place, after any existing transactions with the same date.
+    def add_transaction(self, account_id, amount, type, current_balance, date=None):
         transaction = {
-            'id': uuid.uuid4(),
-            'date': datetime.now(),
+            'id': new_id(),
+            'date': date if date is not None else datetime.now(),
             'type': type,
             'amount': amount,
             'account_id': account_id,
             'balance': current_balance
         }
-        if account_id not in self.transactions:
-            self.transactions[account_id] = []
-        self.transactions[account_id].append(transaction)
+        with self._account_lock(account_id):
+            self._insert(transaction)
+            if self.ledger is not None:
+                self.ledger.record_transaction(transaction)
+        return transaction
+
+    # Adding many transactions to one account at once. postings is a list of (amount, type, balance after) tuples;
+    # they all share one timestamp and their ids are allocated in one block. The rows go straight into the account's
+    # columns and reach the ledger as a single record. Returns them as a TransactionColumns.
+    def add_transactions(self, account_id, postings, date=None):
+        if date is None:
+            date = datetime.now()
+        timestamp = to_timestamp(date)
+        block = TransactionColumns.from_postings(account_id, self.minor_units, timestamp,
+                                                 new_ids_bytes(len(postings)), postings)
+        with self._account_lock(account_id):
+            columns = self._columns(account_id)
+            if not columns or columns.timestamps[-1] <= timestamp:
+                columns.extend_columns(block)
+                if self.index is not None:
+                    self.index.add_columns(block)
+            else:
+                for transaction in block:
+                    self._insert(transaction)
+            if self.ledger is not None:
+                self.ledger.record_columns(block)
+        return block
+
+    # Adding one transaction to each of many accounts, e.g. a month-end interest run. postings is a list of
+    # (account_id, amount, type, balance after) tuples. All of them share one timestamp and reach the ledger
+    # as a single batch.
+    def add_transactions_for_accounts(self, postings, date=None):
+        if date is None:
+            date = datetime.now()
+        ids = new_ids(len(postings))
+        transactions = [{
+            'id': ids[i],
+            'date': date,
+            'type': type,
+            'amount': amount,
+            'account_id': account_id,
+            'balance': balance
+        } for i, (account_id, amount, type, balance) in enumerate(postings)]
+        for transaction in transactions:
+            with self._account_lock(transaction['account_id']):
+                self._insert(transaction)
+        if self.ledger is not None:
+            self.ledger.record_transactions(transactions)
+        return transactions
+
+    # Adding existing transactions (keeping their ids and dates), e.g. from history_io. They are journalled to the
+    # ledger like new ones.
+    def import_transactions(self, transactions):
+        for transaction in transactions:
+            with self._account_lock(transaction['account_id']):
+                self._insert(transaction)
+        if self.ledger is not None:
+            self.ledger.record_transactions(transactions)
+
+    # Adding a block of existing transactions for one account held as a TransactionColumns. When the block follows
+    # on from the account's history the columns are appended wholesale; otherwise each row is slotted into place.
+    def import_columns(self, block):
+        if block.minor_units != self.minor_units:
+            raise ValueError("Cannot mix minor unit and float transaction histories")
+        with self._account_lock(block.account_id):
+            columns = self._columns(block.account_id)
+            if columns.can_extend_with(block):
+                columns.extend_columns(block)
+                if self.index is not None:
+                    self.index.add_columns(block)
+            else:
+                for transaction in block:
+                    self._insert(transaction)
+        if self.ledger is not None:
+            self.ledger.record_columns(block)
+
+    # Re-inserts a transaction loaded from the ledger on startup
+    def restore_transaction(self, transaction):
+        with self._account_lock(transaction['account_id']):
+            self._insert(transaction)
+
+    # Whether the account already holds the transaction with this date and id
+    def has_transaction(self, account_id, date, id):
+        columns = self.transactions.get(account_id)
+        if not columns:
+            return False
+        with self._account_lock(account_id):
+            return columns.find(to_timestamp(date), id.bytes) is not None
 
-    # Retrieving the transaction with specific date range
+    # Yields a copy of each account's columns, each taken under that account's lock, e.g. for a ledger snapshot
+    def iter_columns(self):
+        for account_id in list(self.transactions):
+            with self._account_lock(account_id):
+                columns = self.transactions[account_id]
+                copy = columns.slice(0, len(columns))
+            yield copy
+
+    def _account_lock(self, account_id):
+        lock = self._locks.get(account_id)
+        if lock is None:
+            with self._locks_lock:
+                lock = self._locks.setdefault(account_id, threading.RLock())
+        return lock
+
+    def _columns(self, account_id):
+        columns = self.transactions.get(account_id)
+        if columns is None:
+            columns = self.transactions[account_id] = TransactionColumns(account_id, self.minor_units)
+        return columns
+
+    # Must be called with the account's lock held
+    def _insert(self, transaction):
+        columns = self._columns(transaction['account_id'])
+        timestamp = to_timestamp(transaction['date'])
+        # Usual case is the newest transaction, which just goes on the end
+        if not columns or columns.timestamps[-1] <= timestamp:
+            columns.append(transaction, timestamp)
+        else:
+            columns.insert(bisect_right(columns.timestamps, timestamp), transaction, timestamp)
+        if self.index is not None:
+            self._index_transaction(transaction, timestamp)
+
+    def _index_transaction(self, transaction, timestamp=None):
+        if timestamp is None:
+            timestamp = to_timestamp(transaction['date'])
+        self.index.add(transaction['account_id'], timestamp, transaction['id'].bytes,
+                       TransactionColumns.type_code(transaction['type']), transaction['amount'])
+
+    # Positions of the first and one past the last transaction in a date range, found by binary search
+    def _date_range(self, columns, start_date, end_date):
+        return (bisect_left(columns.timestamps, to_timestamp(start_date)),
+                bisect_right(columns.timestamps, to_timestamp(end_date)))
+
+    # Retrieving the transaction with specific date range (inclusive), in O(log n + k) using the date index
     def get_transactions_for_account(self, account_id, start_date, end_date):
-        account_transactions = self.transactions.get(account_id, [])
-        return [transaction for transaction in account_transactions
-                if start_date <= transaction['date'] <= end_date]
+        columns = self.transactions.get(account_id)
+        if not columns:
+            return []
+        with self._account_lock(account_id):
+            first, last = self._date_range(columns, start_date, end_date)
+            return columns[first:last]
+
+    # Copy of the account's transactions in a date range (inclusive) as a TransactionColumns
+    def get_columns_for_account(self, account_id, start_date, end_date):
+        columns = self.transactions.get(account_id)
+        if not columns:
+            return TransactionColumns(account_id, self.minor_units)
+        with self._account_lock(account_id):
+            first, last = self._date_range(columns, start_date, end_date)
+            return columns.slice(first, last)
+
+    # Net effect of all the account's transactions up to and including date
+    def net_change_until(self, account_id, date):
+        columns = self.transactions.get(account_id)
+        if not columns:
+            return 0
+        with self._account_lock(account_id):
+            return columns.net_change_until(date)
+
+    # Lazily yielding the transactions in a date range without building them all at once. offset skips that many
+    # transactions into the range and limit caps how many are yielded, so a caller can page through a long history.
+    # Rows are copied under the account's lock ITER_PAGE_SIZE at a time and each page is yielded before the next is
+    # copied, so memory use stays flat however long the range. Each page resumes just after the last row yielded
+    # (found again by its timestamp and id), so back-dated postings made in between don't repeat or skip rows.
+    def iter_transactions_for_account(self, account_id, start_date, end_date, offset=0, limit=None):
+        columns = self.transactions.get(account_id)
+        if not columns:
+            return
+        lock = self._account_lock(account_id)
+        end_timestamp = to_timestamp(end_date)
+        remaining = limit
+        last_row = None  # (timestamp, id bytes) of the last row yielded
+        while remaining is None or remaining > 0:
+            with lock:
+                if last_row is None:
+                    first, last = self._date_range(columns, start_date, end_date)
+                    first += offset
+                else:
+                    first = columns.position_after(*last_row)
+                    last = bisect_right(columns.timestamps, end_timestamp)
+                size = ITER_PAGE_SIZE if remaining is None else min(ITER_PAGE_SIZE, remaining)
+                page = columns.slice(first, max(first, min(last, first + size)))
+            if not page:
+                return
+            yield from page
+            last_row = (page.timestamps[-1], bytes(page.ids[-16:]))
+            if remaining is not None:
+                remaining -= len(page)
+
+    # Transactions across all accounts matching every given condition, in date order, using the secondary indexes
+    # (the manager must be made with indexes=True). min_amount and max_amount bound the size of the amount whatever
+    # its sign, so e.g. withdrawals over 500 in the last hour are
+    # find_transactions('withdrawal', min_amount=500, start_date=datetime.now() - timedelta(hours=1)).
+    def find_transactions(self, type=None, min_amount=None, max_amount=None, start_date=None, end_date=None):
+        if self.index is None:
+            raise ValueError("Secondary indexes are not enabled for this transaction manager")
+        if type is not None and type not in TransactionColumns.type_codes:
+            return []
+        matches = self.index.select(TransactionColumns.type_codes[type] if type is not None else None,
+                                    min_amount, max_amount,
+                                    to_timestamp(start_date) if start_date is not None else None,
+                                    to_timestamp(end_date) if end_date is not None else None)
+        transactions = []
+        for account_id, id_bytes, timestamp in matches:
+            with self._account_lock(account_id):
+                transaction = self.transactions[account_id].find(timestamp, id_bytes)
+            if transaction is not None:
+                transactions.append(transaction)
+        return transactions
 
 
 # Defining the account class with banking functions such as account initialisation, add transaction, deposit,
 # get balance (balance enquiry) withdrawal, applying interest rates, withdraw for expense, and print statement
 class Account:
     # Account initialisation
-    def __init__(self, user, name, transaction_manager, account_type='checking', balance=0, interest_rate=0):
+    # auth_service is only needed to check session tokens passed to withdraw_for_expense/Budget.add_category
+    def __init__(self, user, name, transaction_manager, account_type='checking', balance=0, interest_rate=0,
+                 auth_service=None):
         self.user = user
-        self.id = uuid.uuid4()
+        self.id = new_id()
         self.name = name
         self.account_type = account_type
         self.balance = balance
+        self.opening_balance = balance  # Balance before any recorded transaction, used for balance_as_of
         self.interest_rate = float(interest_rate)
-        self.budget = Budget(user)
+        # Money mode follows the transaction manager: ints in minor units, or plain numbers
+        self.minor_units = transaction_manager.minor_units
+        if self.minor_units and not isinstance(balance, int):
+            raise InvalidTransactionError("Balance must be a whole number of minor units")
+        self.budget = Budget(user, auth_service, self.minor_units)
+        self.auth_service = auth_service
         self.transaction_manager = transaction_manager
+        # Guards balance (and the budget) against concurrent updates. Reentrant so methods can call each other.
+        self.lock = threading.RLock()
+
+    # Re-creates an account from a record written by history_io (or any dict with the same keys)
+    @classmethod
+    def from_record(cls, record, user, transaction_manager, auth_service=None):
+        account = cls(user, record['name'], transaction_manager, account_type=record['account_type'],
+                      balance=record['balance'], interest_rate=record['interest_rate'], auth_service=auth_service)
+        account.id = record['id']
+        account.opening_balance = record['opening_balance']
+        return account
 
     def _add_transaction(self, amount, type):
         self.transaction_manager.add_transaction(self.id, amount, type, self.balance)
 
-    # Deposit money and records it
-    def deposit(self, amount):
+    def _check_amount(self, amount):
+        if self.minor_units and not isinstance(amount, int):
+            raise InvalidTransactionError("Amount must be a whole number of minor units")
         if amount <= 0:
             raise InvalidTransactionError("Amount must be greater than 0")
-        self.balance += amount
-        self._add_transaction(amount, "deposit")
-        return self.balance
+
+    # Formats an amount for the statement: 2 d.p., computed exactly in minor unit mode
+    def _format_amount(self, amount):
+        return format_minor_units(amount) if self.minor_units else "{:.2f}".format(amount)
+
+    # Deposit money and records it
+    def deposit(self, amount):
+        self._check_amount(amount)
+        with self.lock:
+            self.balance += amount
+            self._add_transaction(amount, "deposit")
+            return self.balance
 
     # Withdraw money and records it
     def withdraw(self, amount):
-        if amount <= 0:
-            raise InvalidTransactionError("Amount must be greater than 0")
-        if amount > self.balance:
-            raise InsufficientFundsError("Insufficient funds")
-        self.balance -= amount
-        self._add_transaction(-amount, "withdrawal")
+        self._check_amount(amount)
+        with self.lock:
+            if amount > self.balance:
+                raise InsufficientFundsError("Insufficient funds")
+            self.balance -= amount
+            self._add_transaction(-amount, "withdrawal")
+            return self.balance
+
+    # Posts many deposits and withdrawals in one go. entries is an iterable of ("deposit" | "withdrawal", amount)
+    # pairs applied in order. Every entry is validated and the running balance checked before anything changes,
+    # so either the whole batch is posted or none of it is. Returns the new balance.
+    def post_batch(self, entries):
+        with self.lock:
+            return self._post_batch(entries)
+
+    def _post_batch(self, entries):
+        postings = []
+        balance = self.balance
+        for type, amount in entries:
+            self._check_amount(amount)
+            if type == "deposit":
+                balance += amount
+                postings.append((amount, type, balance))
+            elif type == "withdrawal":
+                if amount > balance:
+                    raise InsufficientFundsError("Insufficient funds")
+                balance -= amount
+                postings.append((-amount, type, balance))
+            else:
+                raise InvalidTransactionError(f"Unknown transaction type '{type}'")
+        if postings:
+            self.transaction_manager.add_transactions(self.id, postings)
+            self.balance = balance
         return self.balance
 
     def get_balance(self):
         return self.balance
 
-    # Applying interest if saving account
+    # Balance at a past moment: the opening balance plus every transaction dated up to and including date.
+    # Uses the running totals kept by the transaction store, so it takes O(log n) time.
+    def balance_as_of(self, date):
+        return self.opening_balance + self.transaction_manager.net_change_until(self.id, date)
+
+    # Balances from start_date to end_date (inclusive) at a fixed interval, as a list of (date, balance) pairs.
+    # interval is a timedelta, or "day" / "month" (month steps keep the day of month where it exists).
+    def balance_series(self, start_date, end_date, interval='day'):
+        series = []
+        if interval == 'month':
+            months = 0
+            date = start_date
+            while date <= end_date:
+                series.append((date, self.balance_as_of(date)))
+                months += 1
+                year, month = divmod(start_date.month - 1 + months, 12)
+                last_day = calendar.monthrange(start_date.year + year, month + 1)[1]
+                date = start_date.replace(year=start_date.year + year, month=month + 1,
+                                          day=min(start_date.day, last_day))
+            return series
+        if interval == 'day':
+            interval = timedelta(days=1)
+        if not isinstance(interval, timedelta):
+            raise ValueError(f"Unknown interval {interval!r}, expected 'day', 'month' or a timedelta")
+        if interval <= timedelta(0):
+            raise ValueError("interval must be positive")
+        date = start_date
+        while date <= end_date:
+            series.append((date, self.balance_as_of(date)))
+            date += interval
+        return series
+
+    # Applying interest if saving account. In minor unit mode the interest is rounded half to even to a whole
+    # minor unit and nothing is posted if it rounds to zero.
     def apply_interest(self):
         if self.account_type == 'savings':
-            interest = self.balance * (self.interest_rate / 100)
-            self.deposit(interest)
+            with self.lock:
+                if self.minor_units:
+                    interest = percent_of_minor_units(self.balance, self.interest_rate)
+                    if interest > 0:
+                        self.deposit(interest)
+                    return
+                interest = self.balance * (self.interest_rate / 100)
+                self.deposit(interest)
 
-    # Expense withdraw and record it in budgets and specific category
-    def withdraw_for_expense(self, amount, category):
-        if not self.user.is_authenticated:
+    # Expense withdraw and record it in budgets and specific category. A session token can be given in place of
+    # the user's is_authenticated flag.
+    def withdraw_for_expense(self, amount, category, token=None):
+        if not is_authorised(self.user, self.auth_service, token):
             raise PermissionError("User not authenticated")
         try:
-            self.withdraw(amount)
-            self.budget.record_expense(category, amount)
+            with self.lock:
+                self.withdraw(amount)
+                self.budget.record_expense(category, amount)
         except ValueError as e:
             print(f"Transaction failed: {e}")
 
     def generate_statement(self, start_date, end_date):
-        # Retrieving all transactions related to the account's ID between a specific date
-        statement_transactions = self.transaction_manager.get_transactions_for_account(self.id, start_date, end_date)
-
-        # Format the statement for printing
-        formatted_statement = "Account Statement for {}: {}\n".format(self.name, self.id)
-        formatted_statement += "Period: {} to {}\n".format(start_date.strftime("%Y-%m-%d"),
-                                                           end_date.strftime("%Y-%m-%d"))
-        formatted_statement += "--------------------------------------\n"
+        return "".join(self.iter_statement(start_date, end_date))
+
+    # Yields the statement one formatted line at a time so it never has to be held in memory as a whole.
+    # offset/limit select a page of transactions, e.g. page n of size 50 is offset=n * 50, limit=50.
+    def iter_statement(self, start_date, end_date, offset=0, limit=None):
+        # Header of the statement
+        yield "Account Statement for {}: {}\n".format(self.name, self.id)
+        yield "Period: {} to {}\n".format(start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d"))
+        yield "--------------------------------------\n"
         # Headers and alignment (left alignment)
-        formatted_statement += "{:<20} {:<10} {:<15} {:<10}\n".format("Date", "Type", "Amount", "Balance")
-        formatted_statement += "--------------------------------------\n"
+        yield "{:<20} {:<10} {:<15} {:<10}\n".format("Date", "Type", "Amount", "Balance")
+        yield "--------------------------------------\n"
 
-        # Iteration through transactions and adding them to the print statement
+        # Retrieving the transactions related to the account's ID between a specific date, one at a time
+        statement_transactions = self.transaction_manager.iter_transactions_for_account(self.id, start_date, end_date,
+                                                                                        offset, limit)
         for transaction in statement_transactions:
-            # Left alignment and 2 d.p. floats
-            formatted_statement += "{:<20} {:<10} {:<15.2f} {:<10.2f}\n".format(
+            # Left alignment and 2 d.p. amounts
+            yield "{:<20} {:<10} {:<15} {:<10}\n".format(
                 transaction['date'].strftime("%Y-%m-%d %H:%M:%S"),
                 transaction['type'],
-                transaction['amount'],
-                transaction['balance']
+                self._format_amount(transaction['amount']),
+                self._format_amount(transaction['balance'])
             )
 
-        return formatted_statement
+    # Writes the statement straight to a file-like object (anything with write()) and returns the number of
+    # transaction lines written, which is also the offset to continue from for the next page.
+    def write_statement(self, file, start_date, end_date, offset=0, limit=None):
+        lines_written = 0
+        for lines_written, line in enumerate(self.iter_statement(start_date, end_date, offset, limit), start=1):
+            file.write(line)
+        # The first 5 lines are the header
+        return offset + max(lines_written - 5, 0)
 
 
 # Defining budget class for different categories
 class Budget:
-    def __init__(self, user):
+    # With minor_units budgets and expenses must be whole minor units (ints) and summaries show them with 2 d.p.
+    def __init__(self, user, auth_service=None, minor_units=False):
         self.user = user
+        self.auth_service = auth_service  # Used to check session tokens
+        self.minor_units = minor_units
         self.categories = {}  # Budget categories
+        self._summary = None  # Cached result of get_overall_summary, cleared whenever a category changes
 
-    def add_category(self, name, budget):
-        if not self.user.is_authenticated:
+    # Each category also keeps running totals of its expenses per day, month and year so period queries never
+    # have to look at individual expenses
+    def add_category(self, name, budget, token=None):
+        if not is_authorised(self.user, self.auth_service, token):
             raise UnauthorizedError("User not authenticated")
-        self.categories[name] = {'budget': budget, 'expenses': 0}
+        self._check_amount(budget)
+        self.categories[name] = {'budget': budget, 'expenses': 0, 'by_day': {}, 'by_month': {}, 'by_year': {}}
+        self._summary = None
 
     def remove_category(self, name):
         if name in self.categories:
             del self.categories[name]
+            self._summary = None
 
     def update_budget(self, name, budget):
+        self._check_amount(budget)
         if name in self.categories:
             self.categories[name]['budget'] = budget
+            self._summary = None
 
-    # Records an expense against a specific category's budget
-    def record_expense(self, category, amount):
+    # Records an expense against a specific category's budget, adding it to the totals for its day, month and year
+    def record_expense(self, category, amount, date=None):
+        self._check_amount(amount)
         if category in self.categories and amount <= self.categories[category]['budget'] - self.categories[category][
             'expenses']:
-            self.categories[category]['expenses'] += amount
+            details = self.categories[category]
+            details['expenses'] += amount
+            if date is None:
+                date = datetime.now()
+            for period, key in (('by_day', date.date()), ('by_month', (date.year, date.month)),
+                                ('by_year', date.year)):
+                details[period][key] = details[period].get(key, 0) + amount
+            self._summary = None
         else:
             raise ValueError("Expense exceeds budget limit or category not found")
 
+    # Amount spent in a category during the day, month or year containing date (default: now),
+    # e.g. get_spent("Groceries", "month") for this month's groceries
+    def get_spent(self, category, period='month', date=None):
+        if category not in self.categories:
+            raise ValueError("Category not found")
+        if date is None:
+            date = datetime.now()
+        if period == 'day':
+            return self.categories[category]['by_day'].get(date.date(), 0)
+        elif period == 'month':
+            return self.categories[category]['by_month'].get((date.year, date.month), 0)
+        elif period == 'year':
+            return self.categories[category]['by_year'].get(date.year, 0)
+        raise ValueError(f"Unknown period '{period}', expected 'day', 'month' or 'year'")
+
+    def _check_amount(self, amount):
+        if self.minor_units and not isinstance(amount, int):
+            raise InvalidTransactionError("Amount must be a whole number of minor units")
+
+    # Amounts are shown as given, or with 2 d.p. in minor unit mode
+    def _format(self, amount):
+        return format_minor_units(amount) if self.minor_units else amount
+
     # Get summary for a specific budget category
     def get_category_summary(self, category):
         if category in self.categories:
             budget = self.categories[category]['budget']
             expenses = self.categories[category]['expenses']
             remaining = budget - expenses
-            return f"Category: {category}, Budget: {budget}, Expenses: {expenses}, Remaining: {remaining}"
+            return (f"Category: {category}, Budget: {self._format(budget)}, Expenses: {self._format(expenses)}, "
+                    f"Remaining: {self._format(remaining)}")
         else:
             return "Category not found"
 
     # Get overall summary of all budget categories
     def get_overall_summary(self):
-        summary = "Budget Summary:\n"
-        for category, details in self.categories.items():
-            summary += f"{category} - Budget: {details['budget']}, Spent: {details['expenses']}, Remaining: {details['budget'] - details['expenses']}\n"
-        return summary
+        if self._summary is None:
+            lines = ["Budget Summary:\n"]
+            for category, details in self.categories.items():
+                budget, expenses = details['budget'], details['expenses']
+                lines.append(f"{category} - Budget: {self._format(budget)}, Spent: {self._format(expenses)}, "
+                             f"Remaining: {self._format(budget - expenses)}\n")
+            self._summary = "".join(lines)
+        return self._summary
+
+
+# Moves amount from source to destination as one atomic step. Both accounts are locked, always in order of their
+# ids, so two opposite transfers between the same pair of accounts cannot deadlock.
+def transfer(source, destination, amount):
+    if source is destination:
+        raise InvalidTransactionError("Cannot transfer to the same account")
+    first, second = sorted((source, destination), key=lock_order)
+    with first.lock, second.lock:
+        # withdraw validates the amount and funds before anything changes, after which deposit cannot fail
+        source.withdraw(amount)
+        destination.deposit(amount)
+    return source.balance, destination.balance
+
+
+# Checks whether an action on behalf of user is allowed: by session token if one is given, otherwise by the
+# user's is_authenticated flag
+def is_authorised(user, auth_service, token=None):
+    if token is None:
+        return user.is_authenticated
+    if auth_service is None:
+        return False
+    try:
+        # Compared by name: a users.UserDirectory may hand out a new User object once the old one left its cache
+        return auth_service.validate_session(token).username == user.username
+    except AuthenticationError:
+        return False
+
+
+# Hot paths timed by metrics.enable(INSTRUMENTED_METHODS) when instrumentation is switched on
+INSTRUMENTED_METHODS = [
+    (AuthenticationService, 'login'),
+    (Account, 'deposit'),
+    (Account, 'withdraw'),
+    (Account, 'withdraw_for_expense'),
+    (Account, 'generate_statement'),
+    (TransactionManager, 'add_transaction'),
+]
 
 
 # Function for running the application.
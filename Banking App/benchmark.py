@@ -0,0 +1,165 @@
+import argparse  # Command line options
+import importlib  # Loads "Personal Finance Manager.py", whose name has spaces in it
+import json  # Machine readable results and baseline
+import os  # Baseline location
+import random  # Synthetic data
+import statistics  # Median of repeated timings
+import sys  # Exit status on regressions
+import time  # Timing
+from datetime import datetime, timedelta
+
+pfm = importlib.import_module("Personal Finance Manager")
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+DEFAULT_SIZES = [1000, 10000, 100000]
+FULL_SIZES = [1000, 10000, 100000, 1000000, 10000000]
+
+# Units where a bigger number is better; for everything else (latencies in seconds) smaller is better
+HIGHER_IS_BETTER = {'ops/s'}
+
+
+# Synthetic data: an account whose history holds size transactions spread evenly over the years before end_date
+def make_account(size, end_date=datetime(2025, 1, 1), years=5, seed=0):
+    rng = random.Random(seed)
+    user = pfm.User("bench", b"")
+    user.is_authenticated = True
+    transaction_manager = pfm.TransactionManager()
+    account = pfm.Account(user, "Benchmark Account", transaction_manager, balance=1000)
+    step = timedelta(days=365 * years) / max(size, 1)
+    date = end_date - step * size
+    balance = account.balance
+    for _ in range(size):
+        amount = round(rng.uniform(-50, 100), 2)
+        if balance + amount < 0:
+            amount = -amount
+        balance += amount
+        transaction_manager.add_transaction(account.id, amount, "deposit" if amount > 0 else "withdrawal", balance,
+                                            date=date)
+        date += step
+    account.balance = balance
+    return account
+
+
+# Runs function repeat times and returns the median wall time in seconds
+def time_call(function, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def bench_deposit_withdraw(size):
+    account = make_account(0)
+
+    def run():
+        for _ in range(size):
+            account.deposit(10)
+            account.withdraw(5)
+
+    return 2 * size / time_call(run, repeat=3), 'ops/s'
+
+
+def bench_post_batch(size):
+    account = make_account(0)
+    entries = [("deposit", 10), ("withdrawal", 5)] * size
+    return 2 * size / time_call(lambda: account.post_batch(entries), repeat=3), 'ops/s'
+
+
+def bench_range_query(account, size):
+    # A one month window at the end of the history
+    end = datetime(2025, 1, 1)
+    start = end - timedelta(days=30)
+    return time_call(lambda: account.transaction_manager.get_transactions_for_account(account.id, start, end)), 's'
+
+
+def bench_statement(account, size):
+    end = datetime(2025, 1, 1)
+    start = end - timedelta(days=30)
+    return time_call(lambda: account.generate_statement(start, end)), 's'
+
+
+def bench_balance_as_of(account, size):
+    dates = [datetime(2020, 1, 1) + timedelta(days=day) for day in range(0, 1800, 7)]
+    account.balance_as_of(dates[-1])  # Builds the running totals once
+    return time_call(lambda: [account.balance_as_of(date) for date in dates]) / len(dates), 's'
+
+
+def bench_login(rounds):
+    auth_service = pfm.AuthenticationService(rounds=rounds)
+    auth_service.register_user("bench", "password123")
+    return time_call(lambda: auth_service.login("bench", "password123"), repeat=3), 's'
+
+
+# Runs every benchmark and returns a list of result dicts
+def run_benchmarks(sizes, rounds, seed=0, log=print):
+    results = []
+
+    def record(name, size, value_unit):
+        value, unit = value_unit
+        result = {'benchmark': name, 'size': size, 'value': value, 'unit': unit}
+        results.append(result)
+        log(json.dumps(result))
+
+    for size in sizes:
+        record('deposit_withdraw', size, bench_deposit_withdraw(size))
+        record('post_batch', size, bench_post_batch(size))
+        account = make_account(size, seed=seed)
+        record('range_query_30d', size, bench_range_query(account, size))
+        record('statement_30d', size, bench_statement(account, size))
+        record('balance_as_of', size, bench_balance_as_of(account, size))
+    for work_factor in rounds:
+        record('login', work_factor, bench_login(work_factor))
+    return results
+
+
+# Compares results with a baseline and returns the list of regressions beyond tolerance (a fraction)
+def compare(results, baseline, tolerance):
+    previous = {(result['benchmark'], result['size']): result for result in baseline}
+    regressions = []
+    for result in results:
+        old = previous.get((result['benchmark'], result['size']))
+        if old is None or old['unit'] != result['unit'] or not old['value']:
+            continue
+        change = (result['value'] - old['value']) / old['value']
+        if result['unit'] in HIGHER_IS_BETTER:
+            change = -change
+        if change > tolerance:
+            regressions.append({'benchmark': result['benchmark'], 'size': result['size'], 'baseline': old['value'],
+                                'value': result['value'], 'unit': result['unit'], 'slower_by': change})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks for the Personal Finance Manager hot paths. "
+                                                 "Each result is printed as one JSON object per line.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help="transaction history sizes to sweep (default: %(default)s)")
+    parser.add_argument('--full', action='store_true', help=f"sweep {FULL_SIZES} (slow)")
+    parser.add_argument('--rounds', type=int, nargs='+', default=[4, 8, 10, 12],
+                        help="bcrypt work factors to time login with (default: %(default)s)")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="baseline file to compare against")
+    parser.add_argument('--save-baseline', action='store_true', help="write these results as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="slowdown (as a fraction) reported as a regression (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=0, help="random seed for the synthetic data")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(FULL_SIZES if args.full else args.sizes, args.rounds, args.seed)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as file:
+            json.dump(results, file, indent=1)
+        return 0
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print(json.dumps({'regression': regression}))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,204 @@
+import csv  # Text import/export
+import json  # Type names in the columnar block headers
+import struct  # Block header fields
+import sys  # Byte order of the columnar data
+import uuid  # Parses account and transaction ids
+from array import array  # Columns read back from the binary format
+from datetime import datetime
+
+# Large buffers so files are read and written in big chunks
+BUFFER_SIZE = 1 << 20
+DEFAULT_CHUNK_SIZE = 100000
+
+TRANSACTION_FIELDS = ['id', 'account_id', 'date', 'type', 'amount', 'balance']
+ACCOUNT_FIELDS = ['id', 'username', 'name', 'account_type', 'balance', 'opening_balance', 'interest_rate']
+
+# Columnar file: magic, one byte order byte ('<' or '>') for the column data, then blocks of
+#   header     little endian: uint32 row count, uint8 minor_units (0/1), uint8 account id kind (0 text, 1 UUID),
+#              uint16 account id length, uint32 type names length
+#   account id UTF-8 text (a UUID in its usual hex form)
+#   type names UTF-8 JSON list; type code n in the block means the n-th name
+#   columns    count x int64 timestamps (microseconds since 1970-01-01), count x amounts and count x balances
+#              (float64, or int64 with minor_units), count x uint8 type codes, count x 16 byte ids
+# Nothing in the file is executable, so it is safe to import and easy to read outside Python.
+COLUMNAR_MAGIC = b'PFMCOL2\n'
+BLOCK_HEADER = struct.Struct('<IBBHI')
+ACCOUNT_ID_TEXT = 0
+ACCOUNT_ID_UUID = 1
+BYTE_ORDER = b'<' if sys.byteorder == 'little' else b'>'
+
+
+# Account ids are UUIDs when created by Account, but anything else is kept as the text it was written as
+def _parse_id(text):
+    try:
+        return uuid.UUID(text)
+    except ValueError:
+        return text
+
+
+def _chunks(iterable, chunk_size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# Writes every transaction in transaction_manager to a CSV file, one account at a time. Returns the row count.
+def export_transactions_csv(transaction_manager, path, chunk_size=DEFAULT_CHUNK_SIZE):
+    count = 0
+    with open(path, 'w', newline='', buffering=BUFFER_SIZE) as file:
+        writer = csv.writer(file)
+        writer.writerow(TRANSACTION_FIELDS)
+        for columns in list(transaction_manager.transactions.values()):
+            for chunk in _chunks(columns, chunk_size):
+                writer.writerows([transaction['id'], transaction['account_id'], transaction['date'].isoformat(),
+                                  transaction['type'], transaction['amount'], transaction['balance']]
+                                 for transaction in chunk)
+                count += len(chunk)
+    return count
+
+
+# Yields the transactions in a CSV file written by export_transactions_csv, as dicts, one row at a time.
+# With minor_units the amounts and balances are read as ints.
+def read_transactions_csv(path, minor_units=False):
+    money_type = int if minor_units else float
+    with open(path, newline='', buffering=BUFFER_SIZE) as file:
+        for row in csv.DictReader(file):
+            yield {
+                'id': uuid.UUID(row['id']),
+                'date': datetime.fromisoformat(row['date']),
+                'type': row['type'],
+                'amount': money_type(row['amount']),
+                'account_id': _parse_id(row['account_id']),
+                'balance': money_type(row['balance'])
+            }
+
+
+# Loads a CSV file of transactions into transaction_manager chunk_size rows at a time, so memory use does not grow
+# with the size of the file. Returns the number of rows loaded.
+def import_transactions_csv(transaction_manager, path, chunk_size=DEFAULT_CHUNK_SIZE):
+    count = 0
+    for chunk in _chunks(read_transactions_csv(path, transaction_manager.minor_units), chunk_size):
+        transaction_manager.import_transactions(chunk)
+        count += len(chunk)
+    return count
+
+
+# Writes every transaction in transaction_manager in the binary columnar format: each account's columns are written
+# as raw arrays, in blocks of at most chunk_size rows. Returns the row count.
+def export_transactions_columnar(transaction_manager, path, chunk_size=DEFAULT_CHUNK_SIZE):
+    with open(path, 'wb', buffering=BUFFER_SIZE) as file:
+        return write_columnar_stream(file, list(transaction_manager.transactions.values()), chunk_size)
+
+
+# Writes the columnar format (magic, byte order and blocks) for an iterable of TransactionColumns to an open binary
+# file. Returns the row count.
+def write_columnar_stream(file, columns_iterable, chunk_size=DEFAULT_CHUNK_SIZE):
+    count = 0
+    file.write(COLUMNAR_MAGIC + BYTE_ORDER)
+    for columns in columns_iterable:
+        type_names = list(columns.type_names)
+        for start in range(0, len(columns), chunk_size):
+            end = min(start + chunk_size, len(columns))
+            account_id = str(columns.account_id).encode('utf-8')
+            types = json.dumps(type_names).encode('utf-8')
+            id_kind = ACCOUNT_ID_UUID if isinstance(columns.account_id, uuid.UUID) else ACCOUNT_ID_TEXT
+            file.write(BLOCK_HEADER.pack(end - start, int(columns.minor_units), id_kind, len(account_id),
+                                         len(types)))
+            file.write(account_id)
+            file.write(types)
+            for column in (columns.timestamps, columns.amounts, columns.balances, columns.types):
+                file.write(memoryview(column)[start:end])
+            file.write(memoryview(columns.ids)[16 * start:16 * end])
+            count += end - start
+    return count
+
+
+# Reads exactly size bytes of a columnar file, raising ValueError if it ends first
+def _read_exactly(file, size, path, part):
+    data = file.read(size)
+    if len(data) < size:
+        raise ValueError(f"'{path}' ends in the middle of a block's {part}")
+    return data
+
+
+# Yields the blocks of a columnar file as TransactionColumns objects (made with columns_class), one at a time.
+# Type codes are translated to the codes of the running process. A block is only yielded once all of it has been
+# read, so a truncated file raises ValueError before any of its last block is loaded.
+def read_transactions_columnar(path, columns_class):
+    with open(path, 'rb', buffering=BUFFER_SIZE) as file:
+        yield from read_columnar_stream(file, path, columns_class)
+
+
+# Like read_transactions_columnar, for the columnar format from the current position of an open binary file to its
+# end. path is only used in error messages.
+def read_columnar_stream(file, path, columns_class):
+    if file.read(len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+        raise ValueError(f"'{path}' is not a columnar transaction file")
+    byte_order = file.read(1)
+    if byte_order not in (b'<', b'>'):
+        raise ValueError(f"'{path}' has no valid byte order after its magic")
+    swap = byte_order != BYTE_ORDER
+    while True:
+        prefix = file.read(BLOCK_HEADER.size)
+        if not prefix:
+            return
+        if len(prefix) < BLOCK_HEADER.size:
+            raise ValueError(f"'{path}' ends in the middle of a block header")
+        count, minor_units, id_kind, id_length, types_length = BLOCK_HEADER.unpack(prefix)
+        account_id = _read_exactly(file, id_length, path, 'account id').decode('utf-8')
+        if id_kind == ACCOUNT_ID_UUID:
+            account_id = uuid.UUID(account_id)
+        type_names = json.loads(_read_exactly(file, types_length, path, 'type names').decode('utf-8'))
+        block = columns_class(account_id, bool(minor_units))
+        for column in (block.timestamps, block.amounts, block.balances, block.types):
+            column.frombytes(_read_exactly(file, count * column.itemsize, path, 'columns'))
+            if swap:
+                column.byteswap()
+        block.ids = bytearray(_read_exactly(file, 16 * count, path, 'ids'))
+        translation = bytes(columns_class.type_code(name) for name in type_names)
+        block.types = array('B', block.types.tobytes().translate(translation.ljust(256, b'\0')))
+        yield block
+
+
+# Loads a columnar file into transaction_manager block by block. Returns the number of rows loaded.
+def import_transactions_columnar(transaction_manager, path, columns_class):
+    count = 0
+    for block in read_transactions_columnar(path, columns_class):
+        transaction_manager.import_columns(block)
+        count += len(block)
+    return count
+
+
+# Writes the given accounts to a CSV file. Returns the row count.
+def export_accounts_csv(accounts, path):
+    count = 0
+    with open(path, 'w', newline='', buffering=BUFFER_SIZE) as file:
+        writer = csv.writer(file)
+        writer.writerow(ACCOUNT_FIELDS)
+        for account in accounts:
+            writer.writerow([account.id, account.user.username if account.user is not None else '', account.name,
+                             account.account_type, account.balance, account.opening_balance, account.interest_rate])
+            count += 1
+    return count
+
+
+# Yields the accounts in a CSV file written by export_accounts_csv as dicts, ready for Account.from_record.
+# With minor_units the balances are read as ints.
+def read_accounts_csv(path, minor_units=False):
+    money_type = int if minor_units else float
+    with open(path, newline='', buffering=BUFFER_SIZE) as file:
+        for row in csv.DictReader(file):
+            yield {
+                'id': _parse_id(row['id']),
+                'username': row['username'],
+                'name': row['name'],
+                'account_type': row['account_type'],
+                'balance': money_type(row['balance']),
+                'opening_balance': money_type(row['opening_balance']),
+                'interest_rate': float(row['interest_rate'])
+            }
@@ -0,0 +1,110 @@
+import threading  # Guards the indexes against concurrent inserts
+from array import array  # Compact posting lists
+from bisect import bisect_left, bisect_right  # Time ordered posting lists
+
+
+# Amount bucket of a transaction: the bit length of the whole part of the amount's size, so bucket b holds
+# amounts (either sign) from 2**(b-1) up to 2**b, and bucket 0 everything under 1
+def amount_bucket(amount):
+    return int(abs(amount)).bit_length()
+
+
+# A time ordered list of references to transactions, with the columns needed to filter them without looking the
+# transactions up: timestamp, amount and type code. References are (account_id, id bytes) pairs, which stay valid
+# when back-dated postings shift a transaction's position in its account.
+class PostingList:
+    def __init__(self, money_type='d'):
+        self.timestamps = array('q')
+        self.amounts = array(money_type)
+        self.types = array('B')
+        self.refs = []
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def add(self, timestamp, amount, type_code, ref):
+        if not self.timestamps or self.timestamps[-1] <= timestamp:
+            position = len(self.timestamps)
+        else:
+            position = bisect_right(self.timestamps, timestamp)
+        self.timestamps.insert(position, timestamp)
+        self.amounts.insert(position, amount)
+        self.types.insert(position, type_code)
+        self.refs.insert(position, ref)
+
+    # Positions of the entries between two timestamps (inclusive, None for open ended)
+    def range(self, start=None, end=None):
+        first = 0 if start is None else bisect_left(self.timestamps, start)
+        last = len(self.timestamps) if end is None else bisect_right(self.timestamps, end)
+        return first, max(first, last)
+
+
+# Optional secondary indexes over every account's transactions, kept up to date as transactions are added:
+# one list in global time order, one per transaction type and one per amount bucket. select() works out how many
+# entries each usable index holds for the time range asked for (two binary searches per list) and scans the
+# smallest.
+class TransactionIndex:
+    def __init__(self, minor_units=False):
+        self._money_type = 'q' if minor_units else 'd'
+        self._lock = threading.Lock()
+        self.by_time = PostingList(self._money_type)
+        self.by_type = {}  # Key: type code, Value: PostingList
+        self.by_amount = {}  # Key: amount bucket, Value: PostingList
+
+    def __len__(self):
+        return len(self.by_time)
+
+    def add(self, account_id, timestamp, id_bytes, type_code, amount):
+        ref = (account_id, id_bytes)
+        with self._lock:
+            self.by_time.add(timestamp, amount, type_code, ref)
+            self._list(self.by_type, type_code).add(timestamp, amount, type_code, ref)
+            self._list(self.by_amount, amount_bucket(amount)).add(timestamp, amount, type_code, ref)
+
+    # Adds every row of a TransactionColumns
+    def add_columns(self, columns):
+        account_id = columns.account_id
+        ids = columns.ids
+        for position, (timestamp, amount, type_code) in enumerate(zip(columns.timestamps, columns.amounts,
+                                                                       columns.types)):
+            self.add(account_id, timestamp, bytes(ids[16 * position:16 * position + 16]), type_code, amount)
+
+    # References (account_id, id bytes, timestamp) of the transactions matching every given condition, in time
+    # order. type_code selects one transaction type; min_amount/max_amount bound the size of the amount (sign is
+    # ignored, so "withdrawals over 500" is type withdrawal with min_amount=500); start/end bound the timestamp.
+    def select(self, type_code=None, min_amount=None, max_amount=None, start=None, end=None):
+        with self._lock:
+            candidates = [[(self.by_time, *self.by_time.range(start, end))]]
+            if type_code is not None:
+                posting_list = self.by_type.get(type_code)
+                if posting_list is None:
+                    return []
+                candidates.append([(posting_list, *posting_list.range(start, end))])
+            if min_amount is not None or max_amount is not None:
+                low = amount_bucket(min_amount) if min_amount is not None else 0
+                high = amount_bucket(max_amount) if max_amount is not None else None
+                candidates.append([(posting_list, *posting_list.range(start, end))
+                                   for bucket, posting_list in self.by_amount.items()
+                                   if low <= bucket and (high is None or bucket <= high)])
+            # Cheapest plan: the index with the fewest entries to scan
+            plan = min(candidates, key=lambda ranges: sum(last - first for _, first, last in ranges))
+
+            matches = []
+            for posting_list, first, last in plan:
+                for position in range(first, last):
+                    if type_code is not None and posting_list.types[position] != type_code:
+                        continue
+                    size = abs(posting_list.amounts[position])
+                    if (min_amount is not None and size < min_amount) or (max_amount is not None and size > max_amount):
+                        continue
+                    account_id, id_bytes = posting_list.refs[position]
+                    matches.append((account_id, id_bytes, posting_list.timestamps[position]))
+        if len(plan) > 1:
+            matches.sort(key=lambda match: match[2])
+        return matches
+
+    def _list(self, lists, key):
+        posting_list = lists.get(key)
+        if posting_list is None:
+            posting_list = lists[key] = PostingList(self._money_type)
+        return posting_list
@@ -0,0 +1,109 @@
+from contextlib import ExitStack  # Holds the locks of every account in a run
+from decimal import Decimal, ROUND_HALF_EVEN  # Exact interest for accounts kept in minor units
+import numpy as np  # Vectorised interest calculation
+from utility import percent_of_minor_units, lock_order
+
+# Day count conventions: how the days between two dates are counted and how many make a year
+ACTUAL_365 = 'actual/365'
+ACTUAL_360 = 'actual/360'
+THIRTY_360 = '30/360'
+
+SIMPLE = 'simple'
+DAILY = 'daily'
+
+
+# Days between start_date and end_date and days in a year, under a day count convention
+def day_count_days(start_date, end_date, day_count=ACTUAL_365):
+    if day_count == ACTUAL_365:
+        return (end_date - start_date).days, 365
+    elif day_count == ACTUAL_360:
+        return (end_date - start_date).days, 360
+    elif day_count == THIRTY_360:
+        # US 30/360: day 31 counts as day 30
+        start_day = min(start_date.day, 30)
+        end_day = min(end_date.day, 30) if start_day == 30 else end_date.day
+        days = (360 * (end_date.year - start_date.year) + 30 * (end_date.month - start_date.month)
+                + end_day - start_day)
+        return days, 360
+    raise ValueError(f"Unknown day count convention '{day_count}'")
+
+
+# Fraction of a year between start_date and end_date under a day count convention
+def year_fraction(start_date, end_date, day_count=ACTUAL_365):
+    days, days_per_year = day_count_days(start_date, end_date, day_count)
+    return days / days_per_year
+
+
+# Calculates interest for arrays of balances and annual rates (in percent).
+# Without dates, each rate is applied once per call, the same as Account.apply_interest. With start_date/end_date
+# the rate is treated as annual and scaled by the year fraction, either simply or compounded daily.
+def calculate_interest(balances, rates, start_date=None, end_date=None, compounding=SIMPLE, day_count=ACTUAL_365):
+    balances = np.asarray(balances, dtype=np.float64)
+    rates = np.asarray(rates, dtype=np.float64) / 100
+    if start_date is None or end_date is None:
+        return balances * rates
+    fraction = year_fraction(start_date, end_date, day_count)
+    if compounding == SIMPLE:
+        return balances * rates * fraction
+    elif compounding == DAILY:
+        days_per_year = 360 if day_count in (ACTUAL_360, THIRTY_360) else 365
+        days = fraction * days_per_year
+        return balances * np.expm1(days * np.log1p(rates / days_per_year))
+    raise ValueError(f"Unknown compounding '{compounding}', expected '{SIMPLE}' or '{DAILY}'")
+
+
+# Interest on a balance in whole minor units, worked out in Decimal and rounded half to even like
+# Account.apply_interest, so the result does not depend on how the rate happens to be stored as a float
+def calculate_minor_units_interest(balance, rate, start_date=None, end_date=None, compounding=SIMPLE,
+                                   day_count=ACTUAL_365):
+    if start_date is None or end_date is None:
+        return percent_of_minor_units(balance, rate)
+    days, days_per_year = day_count_days(start_date, end_date, day_count)
+    rate = Decimal(str(rate)) / 100
+    if compounding == SIMPLE:
+        interest = Decimal(balance) * rate * days / days_per_year
+    elif compounding == DAILY:
+        interest = Decimal(balance) * ((1 + rate / days_per_year) ** days - 1)
+    else:
+        raise ValueError(f"Unknown compounding '{compounding}', expected '{SIMPLE}' or '{DAILY}'")
+    return int(interest.to_integral_value(ROUND_HALF_EVEN))
+
+
+# Applies interest to every savings account in accounts at once. Interest is calculated for all of them in one
+# vectorised step, then posted as "deposit" transactions in one batch per TransactionManager. Every account in the
+# run is locked (in id order, like transfer) while its balance is read and updated. Returns the number of accounts
+# that were credited.
+def apply_interest_bulk(accounts, start_date=None, end_date=None, compounding=SIMPLE, day_count=ACTUAL_365):
+    eligible = sorted((account for account in accounts if account.account_type == 'savings'), key=lock_order)
+    if not eligible:
+        return 0
+    with ExitStack() as stack:
+        for account in eligible:
+            stack.enter_context(account.lock)
+        # Float accounts are calculated together with NumPy; accounts kept in minor units one by one, exactly
+        float_accounts = [account for account in eligible if not account.minor_units]
+        balances = np.fromiter((account.balance for account in float_accounts), dtype=np.float64,
+                               count=len(float_accounts))
+        rates = np.fromiter((account.interest_rate for account in float_accounts), dtype=np.float64,
+                            count=len(float_accounts))
+        float_interest = iter(calculate_interest(balances, rates, start_date, end_date, compounding,
+                                                 day_count).tolist())
+
+        postings = {}  # Key: id of TransactionManager, Value: (TransactionManager, list of postings)
+        credited = 0
+        for account in eligible:
+            if account.minor_units:
+                amount = calculate_minor_units_interest(account.balance, account.interest_rate, start_date, end_date,
+                                                        compounding, day_count)
+            else:
+                amount = next(float_interest)
+            # Deposits must be positive, so accounts with no interest are left alone
+            if amount <= 0:
+                continue
+            balance = account.balance = account.balance + amount
+            manager = account.transaction_manager
+            postings.setdefault(id(manager), (manager, []))[1].append((account.id, amount, "deposit", balance))
+            credited += 1
+        for manager, manager_postings in postings.values():
+            manager.add_transactions_for_accounts(manager_postings)
+    return credited
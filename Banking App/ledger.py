@@ -0,0 +1,347 @@
+import json  # Users in snapshots
+import mmap  # Reads journal segments without copying them into memory
+import os  # File handling and fsync
+import pickle  # Encodes record payloads
+import struct  # Length/checksum framing of journal records
+import threading  # Serialises appends from several threads, background snapshots
+import time  # Interval based fsync
+import zlib  # crc32 checksums to detect torn writes
+from array import array  # Type codes of columns records
+import history_io  # Columnar format of the transactions in snapshots
+
+# Each journal record is framed as <payload length><crc32 of payload><payload>
+RECORD_HEADER = struct.Struct('<II')
+
+# Record kinds stored as the first item of each payload
+USER_RECORD = 0
+TRANSACTION_RECORD = 1
+# A block of one account's transactions as raw columns: (COLUMNS_RECORD, account id, minor_units, type names,
+# timestamps, amounts, balances, type codes, ids). Type code n means the n-th of the record's type names.
+COLUMNS_RECORD = 2
+
+# fsync policies: after every write, at most once per fsync_interval seconds, or leave it to the OS
+FSYNC_ALWAYS = 'always'
+FSYNC_INTERVAL = 'interval'
+FSYNC_NEVER = 'never'
+
+# Snapshot file: magic, uint64 length of the users JSON ([[username, password hash], ...]), the users JSON, then the
+# transactions in the history_io columnar format
+SNAPSHOT_MAGIC = b'PFMSNAP2'
+SNAPSHOT_USERS_LENGTH = struct.Struct('<Q')
+
+
+# Iterates over one journal segment using a memory map, yielding (record, offset just past the record). Stops quietly
+# at the first incomplete or corrupt record, e.g. a write torn by a crash.
+def read_segment(path):
+    if os.path.getsize(path) == 0:
+        return
+    with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        size = len(data)
+        offset = 0
+        while offset + RECORD_HEADER.size <= size:
+            length, checksum = RECORD_HEADER.unpack_from(data, offset)
+            start = offset + RECORD_HEADER.size
+            end = start + length
+            if end > size:
+                break
+            payload = data[start:end]
+            if zlib.crc32(payload) != checksum:
+                break
+            yield pickle.loads(payload), end
+            offset = end
+
+
+# Append-only journal plus snapshots for AuthenticationService users and TransactionManager transactions.
+#
+# The journal is split into numbered segments (journal-<n>.log). A snapshot (snapshot-<n>.bin) holds the full state
+# as of the start of segment n, so after a snapshot is written older segments are deleted and startup only loads the
+# newest snapshot and replays the segments after it.
+#
+# Every record_* call has written its records to the journal, with fsync_policy applied, before it returns. Writes
+# are group committed: while one thread writes and fsyncs, records from other threads collect in a buffer, and the
+# next writer writes all of them at once, so concurrent writers share one write and one fsync.
+#
+# Every snapshot_every records a new snapshot is taken on a background thread, so the posting that reached the limit
+# (and anyone waiting on its account) doesn't wait for it. Snapshots hold the transactions as raw columns in the
+# history_io columnar format and are loaded back with TransactionManager.import_columns.
+#
+# Transactions are inserted into the TransactionManager before they are journalled, so a snapshot can already hold
+# transactions whose records only reach the journal after it (another thread's, or the rest of a batch). On replay,
+# transaction records in the snapshot's own segment that the TransactionManager already holds are skipped.
+class Ledger:
+    def __init__(self, directory, fsync_policy=FSYNC_INTERVAL, fsync_interval=1.0, snapshot_every=1000000):
+        if fsync_policy not in (FSYNC_ALWAYS, FSYNC_INTERVAL, FSYNC_NEVER):
+            raise ValueError(f"Unknown fsync policy '{fsync_policy}'")
+        self.directory = directory
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        self.snapshot_every = snapshot_every
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.RLock()  # Guards the buffer, the counters and the current segment
+        self._write_lock = threading.Lock()  # Held by the thread writing the buffer; taken before _lock
+        self._snapshot_lock = threading.Lock()  # Held while a snapshot is being taken
+        self._snapshot_thread = None
+        self._buffer = []  # Encoded records waiting to be written
+        self._appended = 0  # Records appended to the buffer so far
+        self._written = 0  # Records written to the journal so far
+        self._file = None  # Current journal segment
+        self._segment = None  # Number of the current journal segment
+        self._records_since_snapshot = 0
+        self._last_fsync = time.monotonic()
+        self._replaying = False
+        self.auth_service = None
+        self.transaction_manager = None
+
+    # Loads the latest snapshot and the journal written since, into auth_service and transaction_manager, then
+    # opens the journal for appending. Both objects should have been created with ledger=self.
+    def attach(self, auth_service, transaction_manager):
+        self.auth_service = auth_service
+        self.transaction_manager = transaction_manager
+        snapshot_segment = self._latest_snapshot()
+        self._replaying = True
+        try:
+            if snapshot_segment is not None:
+                self._load_snapshot(self._snapshot_path(snapshot_segment))
+            segments = [n for n in self._segments() if snapshot_segment is None or n >= snapshot_segment]
+            for segment in segments:
+                path = self._segment_path(segment)
+                valid_end = 0
+                for record, valid_end in read_segment(path):
+                    self._records_since_snapshot += self._apply(record, segment == snapshot_segment)
+                # Drop a torn record at the end of the segment so new appends start on a clean boundary
+                if valid_end < os.path.getsize(path):
+                    with open(path, 'r+b') as file:
+                        file.truncate(valid_end)
+        finally:
+            self._replaying = False
+        self._open_segment(segments[-1] if segments else (snapshot_segment or 0))
+
+    def record_user(self, user):
+        self._write_through(self._append((USER_RECORD, user.username, user.password_hash)))
+        self._snapshot_if_due()
+
+    def record_transaction(self, transaction):
+        self._write_through(self._append((TRANSACTION_RECORD,) + self._encode_transaction(transaction)))
+        self._snapshot_if_due()
+
+    def record_transactions(self, transactions):
+        if self._replaying:
+            return
+        with self._lock:
+            for transaction in transactions:
+                self._append((TRANSACTION_RECORD,) + self._encode_transaction(transaction))
+            sequence = self._appended
+        self._write_through(sequence)
+        self._snapshot_if_due()
+
+    # Journals a TransactionColumns (e.g. a batch from TransactionManager.add_transactions) as one record
+    def record_columns(self, block):
+        if self._replaying or not block:
+            return
+        codes = block.types.tobytes()
+        used = sorted(set(codes))
+        translation = bytearray(256)
+        for code, type_code in enumerate(used):
+            translation[type_code] = code
+        record = (COLUMNS_RECORD, block.account_id, block.minor_units, [block.type_names[code] for code in used],
+                  block.timestamps, block.amounts, block.balances, codes.translate(translation), bytes(block.ids))
+        self._write_through(self._append(record, len(block)))
+        self._snapshot_if_due()
+
+    # Writes any buffered records and applies the fsync policy
+    def commit(self):
+        self._write_through(self._appended)
+
+    # Starts a new journal segment, writes the full current state to a snapshot for it and removes the files the
+    # snapshot replaces. Does nothing if another thread is already taking a snapshot.
+    def snapshot(self):
+        if not self._snapshot_lock.acquire(blocking=False):
+            return
+        try:
+            with self._write_lock, self._lock:
+                if self._file is None:
+                    return
+                self._write_buffer()
+                new_segment = self._segment + 1
+                self._open_segment(new_segment)
+                self._records_since_snapshot = 0
+            # Everything journalled to the older segments was inserted before it was journalled, so it is in the state
+            # read below. No ledger lock is held here: threads journal while holding their account's lock.
+            users = json.dumps([[username, password_hash.decode('ascii')]
+                                for username, password_hash in self.auth_service.user_records()]).encode('utf-8')
+            path = self._snapshot_path(new_segment)
+            temp_path = path + '.tmp'
+            with open(temp_path, 'wb', buffering=history_io.BUFFER_SIZE) as file:
+                file.write(SNAPSHOT_MAGIC + SNAPSHOT_USERS_LENGTH.pack(len(users)) + users)
+                history_io.write_columnar_stream(file, self.transaction_manager.iter_columns())
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp_path, path)
+            self._fsync_directory()
+
+            for segment in self._segments():
+                if segment < new_segment:
+                    os.remove(self._segment_path(segment))
+            for segment in self._snapshots():
+                if segment < new_segment:
+                    os.remove(self._snapshot_path(segment))
+        finally:
+            self._snapshot_lock.release()
+
+    # Waits for a background snapshot to finish, then writes what is left and closes the journal
+    def close(self):
+        thread = self._snapshot_thread
+        if thread is not None:
+            thread.join()
+        with self._write_lock, self._lock:
+            if self._file is not None:
+                self._write_buffer()
+                os.fsync(self._file.fileno())
+                self._file.close()
+                self._file = None
+
+    # Encodes a record holding rows users or transactions into the buffer and returns its sequence number (None
+    # while replaying)
+    def _append(self, record, rows=1):
+        if self._replaying:
+            return None
+        payload = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._buffer.append(RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload)
+            self._appended += 1
+            self._records_since_snapshot += rows
+            return self._appended
+
+    # Returns once the record with the given sequence number has been written. The first thread to get here writes
+    # the whole buffer; threads that queued records meanwhile find them written, or write the next group themselves.
+    def _write_through(self, sequence):
+        if sequence is None:
+            return
+        with self._write_lock:
+            if self._written >= sequence:
+                return
+            with self._lock:
+                if self._file is None:  # Not attached yet, or closed: left in the buffer
+                    return
+                data = b''.join(self._buffer)
+                self._buffer.clear()
+                written = self._appended
+            self._write(data)
+            self._written = written
+
+    # Writes the buffer while holding both _write_lock and _lock
+    def _write_buffer(self):
+        data = b''.join(self._buffer)
+        self._buffer.clear()
+        self._write(data)
+        self._written = self._appended
+
+    # Writes data to the current segment and applies the fsync policy. Must be called with _write_lock held.
+    def _write(self, data):
+        if not data:
+            return
+        self._file.write(data)
+        self._file.flush()
+        now = time.monotonic()
+        if self.fsync_policy == FSYNC_ALWAYS or (
+                self.fsync_policy == FSYNC_INTERVAL and now - self._last_fsync >= self.fsync_interval):
+            os.fsync(self._file.fileno())
+            self._last_fsync = now
+
+    # Called once a record_* call has journalled all its records, so a batch is never split by a snapshot. The
+    # snapshot runs on its own thread; at most one runs at a time.
+    def _snapshot_if_due(self):
+        if self._replaying or self.auth_service is None:
+            return
+        if self._records_since_snapshot >= self.snapshot_every:
+            with self._lock:
+                if self._snapshot_thread is not None and self._snapshot_thread.is_alive():
+                    return
+                self._snapshot_thread = threading.Thread(target=self.snapshot, name='ledger-snapshot', daemon=True)
+                self._snapshot_thread.start()
+
+    # Replays a journal record and returns the number of rows it held. With skip_known, transactions the
+    # TransactionManager already holds (from the snapshot) are left out; a columns record was inserted under one hold
+    # of its account's lock, so it is either wholly in the snapshot or not at all.
+    def _apply(self, record, skip_known=False):
+        manager = self.transaction_manager
+        if record[0] == USER_RECORD:
+            self.auth_service.restore_user(record[1], record[2])
+            return 1
+        if record[0] == TRANSACTION_RECORD:
+            transaction = self._decode_transaction(record[1:])
+            if not (skip_known and manager.has_transaction(transaction['account_id'], transaction['date'],
+                                                           transaction['id'])):
+                manager.restore_transaction(transaction)
+            return 1
+        _, account_id, minor_units, type_names, timestamps, amounts, balances, codes, ids = record
+        block = manager.columns_class(account_id, minor_units)
+        block.timestamps, block.amounts, block.balances = timestamps, amounts, balances
+        translation = bytes(manager.columns_class.type_code(name) for name in type_names)
+        block.types = array('B', codes.translate(translation.ljust(256, b'\0')))
+        block.ids = bytearray(ids)
+        first = block[0]
+        if not (skip_known and manager.has_transaction(account_id, first['date'], first['id'])):
+            manager.import_columns(block)
+        return len(block)
+
+    def _load_snapshot(self, path):
+        with open(path, 'rb', buffering=history_io.BUFFER_SIZE) as file:
+            if file.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+                raise ValueError(f"'{path}' is not a ledger snapshot")
+            (users_length,) = SNAPSHOT_USERS_LENGTH.unpack(file.read(SNAPSHOT_USERS_LENGTH.size))
+            for username, password_hash in json.loads(file.read(users_length).decode('utf-8')):
+                self.auth_service.restore_user(username, password_hash.encode('ascii'))
+            manager = self.transaction_manager
+            for block in history_io.read_columnar_stream(file, path, manager.columns_class):
+                manager.import_columns(block)
+
+    @staticmethod
+    def _encode_transaction(transaction):
+        return (transaction['id'], transaction['date'], transaction['type'], transaction['amount'],
+                transaction['account_id'], transaction['balance'])
+
+    @staticmethod
+    def _decode_transaction(fields):
+        id, date, type, amount, account_id, balance = fields
+        return {'id': id, 'date': date, 'type': type, 'amount': amount, 'account_id': account_id, 'balance': balance}
+
+    def _open_segment(self, segment):
+        if self._file is not None:
+            self._file.close()
+        self._segment = segment
+        self._file = open(self._segment_path(segment), 'ab')
+
+    def _fsync_directory(self):
+        if hasattr(os, 'O_DIRECTORY'):
+            descriptor = os.open(self.directory, os.O_DIRECTORY)
+            try:
+                os.fsync(descriptor)
+            finally:
+                os.close(descriptor)
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, f'journal-{segment:08d}.log')
+
+    def _snapshot_path(self, segment):
+        return os.path.join(self.directory, f'snapshot-{segment:08d}.bin')
+
+    def _numbered_files(self, prefix, suffix):
+        numbers = []
+        for name in os.listdir(self.directory):
+            if name.startswith(prefix) and name.endswith(suffix):
+                number = name[len(prefix):-len(suffix)]
+                if number.isdigit():
+                    numbers.append(int(number))
+        return sorted(numbers)
+
+    def _segments(self):
+        return self._numbered_files('journal-', '.log')
+
+    def _snapshots(self):
+        return self._numbered_files('snapshot-', '.bin')
+
+    def _latest_snapshot(self):
+        snapshots = self._snapshots()
+        return snapshots[-1] if snapshots else None
@@ -0,0 +1,140 @@
+import functools  # Keeps the wrapped methods' names and docs
+import os  # Atomic file replace when dumping
+import threading  # Guards the counters and runs the metrics endpoint
+import time  # Latency measurement
+from bisect import bisect_left  # Finds a latency's histogram bucket
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer  # Optional metrics endpoint
+
+# Upper bounds (seconds) of the latency histogram buckets
+DEFAULT_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+# Call counts, failure counts by exception type and a latency histogram for each instrumented method
+class MetricsRegistry:
+    def __init__(self, buckets=DEFAULT_BUCKETS, prefix='pfm'):
+        self.buckets = tuple(buckets)
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._calls = {}  # Key: method name, Value: count
+        self._failures = {}  # Key: (method name, exception name), Value: count
+        self._latency = {}  # Key: method name, Value: [bucket counts..., +Inf count, sum of seconds]
+
+    def observe(self, name, seconds, exception=None):
+        with self._lock:
+            self._calls[name] = self._calls.get(name, 0) + 1
+            if exception is not None:
+                key = (name, type(exception).__name__)
+                self._failures[key] = self._failures.get(key, 0) + 1
+            histogram = self._latency.get(name)
+            if histogram is None:
+                histogram = self._latency[name] = [0] * (len(self.buckets) + 1) + [0.0]
+            histogram[bisect_left(self.buckets, seconds)] += 1
+            histogram[-1] += seconds
+
+    def reset(self):
+        with self._lock:
+            self._calls.clear()
+            self._failures.clear()
+            self._latency.clear()
+
+    # Copy of the current values: {'calls': {...}, 'failures': {...}, 'latency': {...}}
+    def snapshot(self):
+        with self._lock:
+            return {'calls': dict(self._calls), 'failures': dict(self._failures),
+                    'latency': {name: list(histogram) for name, histogram in self._latency.items()}}
+
+    # The current values in the Prometheus text exposition format
+    def to_prometheus(self):
+        state = self.snapshot()
+        prefix = self.prefix
+        lines = [f'# HELP {prefix}_calls_total Calls to each instrumented method.',
+                 f'# TYPE {prefix}_calls_total counter']
+        for name, count in sorted(state['calls'].items()):
+            lines.append(f'{prefix}_calls_total{{method="{name}"}} {count}')
+
+        lines += [f'# HELP {prefix}_failures_total Calls that raised, by exception type.',
+                  f'# TYPE {prefix}_failures_total counter']
+        for (name, exception), count in sorted(state['failures'].items()):
+            lines.append(f'{prefix}_failures_total{{method="{name}",exception="{exception}"}} {count}')
+
+        lines += [f'# HELP {prefix}_latency_seconds Time spent in each instrumented method.',
+                  f'# TYPE {prefix}_latency_seconds histogram']
+        for name, histogram in sorted(state['latency'].items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, histogram):
+                cumulative += count
+                lines.append(f'{prefix}_latency_seconds_bucket{{method="{name}",le="{bound}"}} {cumulative}')
+            cumulative += histogram[len(self.buckets)]
+            lines.append(f'{prefix}_latency_seconds_bucket{{method="{name}",le="+Inf"}} {cumulative}')
+            lines.append(f'{prefix}_latency_seconds_sum{{method="{name}"}} {histogram[-1]}')
+            lines.append(f'{prefix}_latency_seconds_count{{method="{name}"}} {cumulative}')
+        return '\n'.join(lines) + '\n'
+
+    # Writes the Prometheus text to path, replacing the file in one step so readers never see half of it
+    def dump(self, path):
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w') as file:
+            file.write(self.to_prometheus())
+        os.replace(temp_path, path)
+
+    # Serves the Prometheus text over HTTP on a background thread; call shutdown() on the result to stop it
+    def serve(self, port=9100, host='127.0.0.1'):
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.to_prometheus().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name='metrics', daemon=True).start()
+        return server
+
+
+# The registry the hooks report to, and the original methods they replaced. While nothing is enabled the
+# methods are the untouched originals, so instrumentation costs nothing when it is off.
+registry = MetricsRegistry()
+_originals = {}  # Key: (class, method name), Value: original function
+
+
+def _timed(function, name):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            result = function(*args, **kwargs)
+        except Exception as e:
+            registry.observe(name, time.perf_counter() - start, e)
+            raise
+        registry.observe(name, time.perf_counter() - start)
+        return result
+
+    return wrapper
+
+
+# Wraps each (class, method name) in methods with timing hooks reporting to the module registry
+def enable(methods):
+    for cls, method_name in methods:
+        if (cls, method_name) in _originals:
+            continue
+        original = cls.__dict__[method_name]
+        _originals[(cls, method_name)] = original
+        setattr(cls, method_name, _timed(original, f'{cls.__name__}.{method_name}'))
+
+
+# Puts back the original methods
+def disable():
+    for (cls, method_name), original in _originals.items():
+        setattr(cls, method_name, original)
+    _originals.clear()
+
+
+def is_enabled():
+    return bool(_originals)
@@ -0,0 +1,129 @@
+import argparse  # Command line options
+import importlib  # Loads "Personal Finance Manager.py", whose name has spaces in it
+import os  # Output files and CPU count
+import shutil  # Removes the scratch directory used for archives
+import tempfile  # Scratch directory used for archives
+import time  # Per-shard timing
+import zipfile  # Combined statement archive
+from array import array  # Columns sent to the workers
+from concurrent.futures import ProcessPoolExecutor, as_completed  # Runs the shards in parallel
+from datetime import datetime
+
+import history_io
+import ledger
+
+pfm = importlib.import_module("Personal Finance Manager")
+
+
+# What a worker needs to rebuild one account's statement: its record and the columns of the statement period.
+# Only plain values and arrays are sent, so shards pickle quickly.
+def _account_payload(account, start_date, end_date):
+    manager = account.transaction_manager
+    record = {'id': account.id, 'name': account.name, 'account_type': account.account_type,
+              'balance': account.balance, 'opening_balance': account.opening_balance,
+              'interest_rate': account.interest_rate}
+    block = manager.get_columns_for_account(account.id, start_date, end_date)
+    if not block:
+        return record, manager.minor_units, None
+    window = (block.timestamps, block.amounts, block.balances, block.types, bytes(block.ids), list(block.type_names))
+    return record, manager.minor_units, window
+
+
+# Runs in a worker process: rebuilds each account of the shard and writes its statement to output_dir
+def _render_shard(shard_index, payloads, start_date, end_date, output_dir):
+    started = time.perf_counter()
+    paths = []
+    transactions = 0
+    for record, minor_units, window in payloads:
+        manager = pfm.TransactionManager(minor_units=minor_units)
+        if window is not None:
+            timestamps, amounts, balances, types, ids, type_names = window
+            block = pfm.TransactionColumns(record['id'], minor_units)
+            block.timestamps, block.amounts, block.balances = timestamps, amounts, balances
+            translation = bytes(pfm.TransactionColumns.type_code(name) for name in type_names).ljust(256, b'\0')
+            block.types = array('B', types.tobytes().translate(translation))
+            block.ids = bytearray(ids)
+            manager.import_columns(block)
+            transactions += len(block)
+        account = pfm.Account.from_record(record, None, manager)
+        path = os.path.join(output_dir, f'statement_{account.id}.txt')
+        with open(path, 'w', buffering=history_io.BUFFER_SIZE) as file:
+            account.write_statement(file, start_date, end_date)
+        paths.append(path)
+    return {'shard': shard_index, 'accounts': len(paths), 'transactions': transactions,
+            'seconds': time.perf_counter() - started, 'paths': paths}
+
+
+# Writes a statement for every account, sharding the accounts across a pool of worker processes. Statements go to
+# output_dir as statement_<account id>.txt, or into one zip file if archive is given. progress is called with each
+# shard's result as it finishes. Returns a summary with the per-shard results and the total time.
+def generate_statements(accounts, start_date, end_date, output_dir=None, archive=None, workers=None,
+                        shard_size=None, progress=print):
+    if output_dir is None and archive is None:
+        raise ValueError("Give an output_dir or an archive path")
+    accounts = list(accounts)
+    workers = workers or os.cpu_count() or 1
+    # A few shards per worker keeps the workers busy when some accounts have much longer histories than others
+    shard_size = shard_size or max(1, -(-len(accounts) // (workers * 4)))
+    scratch = tempfile.mkdtemp(prefix='statements') if archive is not None else None
+    target = scratch if scratch is not None else output_dir
+    os.makedirs(target, exist_ok=True)
+
+    started = time.perf_counter()
+    shards = []
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = []
+            for shard_index, first in enumerate(range(0, len(accounts), shard_size)):
+                payloads = [_account_payload(account, start_date, end_date)
+                            for account in accounts[first:first + shard_size]]
+                futures.append(executor.submit(_render_shard, shard_index, payloads, start_date, end_date, target))
+            for done, future in enumerate(as_completed(futures), start=1):
+                result = future.result()
+                shards.append(result)
+                if progress is not None:
+                    progress(f"Shard {result['shard']} done ({done}/{len(futures)}): {result['accounts']} accounts, "
+                             f"{result['transactions']} transactions in {result['seconds']:.3f}s")
+        if archive is not None:
+            with zipfile.ZipFile(archive, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+                for result in shards:
+                    for path in result['paths']:
+                        zip_file.write(path, os.path.basename(path))
+    finally:
+        if scratch is not None:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    shards.sort(key=lambda result: result['shard'])
+    return {'accounts': len(accounts), 'shards': shards, 'seconds': time.perf_counter() - started}
+
+
+# Month-end batch: loads users and transactions from a ledger directory and accounts from an accounts CSV
+# (history_io format), then writes every statement
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a statement for every account in parallel.")
+    parser.add_argument('--ledger', required=True, help="ledger directory holding the transactions")
+    parser.add_argument('--accounts', required=True, help="accounts CSV written by history_io.export_accounts_csv")
+    parser.add_argument('--start', required=True, type=datetime.fromisoformat, help="period start (YYYY-MM-DD)")
+    parser.add_argument('--end', required=True, type=datetime.fromisoformat, help="period end (YYYY-MM-DD)")
+    parser.add_argument('--output-dir', help="directory for one statement file per account")
+    parser.add_argument('--archive', help="zip file to collect the statements in instead")
+    parser.add_argument('--workers', type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument('--minor-units', action='store_true', help="the ledger holds amounts in minor units")
+    args = parser.parse_args(argv)
+
+    journal = ledger.Ledger(args.ledger)
+    auth_service = pfm.AuthenticationService(ledger=journal)
+    transaction_manager = pfm.TransactionManager(ledger=journal, minor_units=args.minor_units)
+    journal.attach(auth_service, transaction_manager)
+    try:
+        accounts = [pfm.Account.from_record(record, auth_service.users.get(record['username']), transaction_manager)
+                    for record in history_io.read_accounts_csv(args.accounts, args.minor_units)]
+        summary = generate_statements(accounts, args.start, args.end, args.output_dir, args.archive, args.workers)
+    finally:
+        journal.close()
+    print(f"Wrote {summary['accounts']} statements in {len(summary['shards'])} shards, "
+          f"{summary['seconds']:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+import importlib
+import os
+import shutil
+import tempfile
+import unittest
+
+import history_io
+
+pfm = importlib.import_module("Personal Finance Manager")
+
+
+class ColumnarFileTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "transactions.bin")
+        transaction_manager = pfm.TransactionManager()
+        account = pfm.Account(None, "Savings", transaction_manager)
+        account.post_batch([("deposit", 1)] * 3)
+        self.account = account
+        history_io.export_transactions_columnar(transaction_manager, self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_round_trip(self):
+        transaction_manager = pfm.TransactionManager()
+        self.assertEqual(history_io.import_transactions_columnar(transaction_manager, self.path,
+                                                                 pfm.TransactionColumns), 3)
+        self.assertEqual([transaction['balance'] for transaction in transaction_manager.transactions[self.account.id]],
+                         [1, 2, 3])
+
+    # A file cut short anywhere must be rejected before any of its last block reaches the TransactionManager
+    def test_truncated_file_is_rejected(self):
+        size = os.path.getsize(self.path)
+        with open(self.path, 'rb') as file:
+            data = file.read()
+        for missing in (1, 3, 16, 20, size - len(history_io.COLUMNAR_MAGIC) - 1 - history_io.BLOCK_HEADER.size):
+            with self.subTest(missing=missing):
+                with open(self.path, 'wb') as file:
+                    file.write(data[:size - missing])
+                transaction_manager = pfm.TransactionManager()
+                with self.assertRaises(ValueError):
+                    history_io.import_transactions_columnar(transaction_manager, self.path, pfm.TransactionColumns)
+                self.assertEqual(len(transaction_manager.transactions.get(self.account.id, ())), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+import importlib
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+
+import ledger
+
+pfm = importlib.import_module("Personal Finance Manager")
+
+
+class LedgerSnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def open(self, **options):
+        journal = ledger.Ledger(self.directory, **options)
+        auth_service = pfm.AuthenticationService(rounds=4, ledger=journal)
+        transaction_manager = pfm.TransactionManager(ledger=journal)
+        journal.attach(auth_service, transaction_manager)
+        return journal, transaction_manager
+
+    # A snapshot due partway through a batch must not leave the rest of the batch both in the snapshot and in the
+    # journal after it
+    def test_batch_crossing_snapshot_is_replayed_once(self):
+        journal, transaction_manager = self.open(snapshot_every=5)
+        account = pfm.Account(None, "Savings", transaction_manager)
+        account.post_batch([("deposit", 1)] * 7)
+        journal.close()
+
+        journal, restored = self.open()
+        try:
+            self.assertEqual(len(restored.transactions[account.id]), 7)
+        finally:
+            journal.close()
+
+    # Another thread may have inserted a transaction but not yet journalled it when a snapshot is taken
+    def test_transaction_in_snapshot_and_journal_is_replayed_once(self):
+        journal, transaction_manager = self.open()
+        transaction = {'id': pfm.new_id(), 'date': datetime.now(), 'type': 'deposit', 'amount': 5,
+                       'account_id': 'account', 'balance': 5}
+        with transaction_manager._account_lock('account'):
+            transaction_manager._insert(transaction)
+        journal.snapshot()
+        journal.record_transaction(transaction)
+        journal.close()
+
+        journal, restored = self.open()
+        try:
+            self.assertEqual(len(restored.transactions['account']), 1)
+        finally:
+            journal.close()
+
+    def test_transactions_after_snapshot_are_replayed(self):
+        journal, transaction_manager = self.open(snapshot_every=3)
+        account = pfm.Account(None, "Savings", transaction_manager)
+        for _ in range(7):
+            account.deposit(1)
+        journal.close()
+
+        journal, restored = self.open()
+        try:
+            self.assertEqual([transaction['balance'] for transaction in restored.transactions[account.id]],
+                             [1, 2, 3, 4, 5, 6, 7])
+        finally:
+            journal.close()
+
+
+    # Every posting is in the journal once deposit returns, without close() or a full group of records
+    def test_postings_are_written_before_returning(self):
+        journal, transaction_manager = self.open(fsync_policy=ledger.FSYNC_ALWAYS)
+        account = pfm.Account(None, "Savings", transaction_manager)
+        account.deposit(1)
+        account.deposit(2)
+
+        recovered, restored = self.open()
+        try:
+            self.assertEqual([transaction['amount'] for transaction in restored.transactions[account.id]], [1, 2])
+        finally:
+            recovered.close()
+            journal.close()
+
+    def test_users_and_transactions_restored_from_snapshot(self):
+        journal, transaction_manager = self.open()
+        journal.auth_service.register_user("alice", "password")
+        account = pfm.Account(None, "Savings", transaction_manager)
+        account.post_batch([("deposit", 1)] * 5)
+        journal.snapshot()
+        account.deposit(1)
+        journal.close()
+
+        journal, restored = self.open()
+        try:
+            self.assertIn("alice", journal.auth_service.users)
+            self.assertEqual([transaction['balance'] for transaction in restored.transactions[account.id]],
+                             [1, 2, 3, 4, 5, 6])
+        finally:
+            journal.close()
+
+
+    def test_batch_is_journalled_as_one_record(self):
+        journal, transaction_manager = self.open()
+        account = pfm.Account(None, "Savings", transaction_manager, balance=10)
+        account.post_batch([("deposit", 5), ("withdrawal", 3), ("deposit", 2)])
+        journal.close()
+        self.assertEqual(len(list(ledger.read_segment(journal._segment_path(journal._segment)))), 1)
+
+        journal, restored = self.open()
+        try:
+            self.assertEqual([(transaction['type'], transaction['amount'], transaction['balance'])
+                              for transaction in restored.transactions[account.id]],
+                             [("deposit", 5, 15), ("withdrawal", -3, 12), ("deposit", 2, 14)])
+        finally:
+            journal.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+import sqlite3  # Embedded on-disk user store
+import threading  # One connection shared between threads
+from collections import OrderedDict  # LRU cache of hot users
+from utility import UserAlreadyExistsError
+
+
+# Disk-backed replacement for the AuthenticationService.users dict, stored in SQLite. It supports the dict
+# operations the service uses (get, [], in, len, iteration, values, update) but only keeps the cache_size most
+# recently used User objects in memory, so memory stays flat however many users there are and nothing is loaded
+# at startup. user_class builds the User objects (it is called as user_class(username, password_hash)).
+#
+# A user that falls out of the cache is rebuilt from disk when next needed, so in-memory state such as
+# is_authenticated does not survive eviction; session tokens are the way to stay logged in.
+#
+# Unlike a dict, adding a username that is already stored raises UserAlreadyExistsError instead of replacing the
+# user, so two stations sharing the database cannot overwrite each other's registrations.
+class UserDirectory:
+    def __init__(self, path, user_class, cache_size=10000):
+        self.path = path
+        self.user_class = user_class
+        self.cache_size = cache_size
+        self._cache = OrderedDict()  # Key: username, Value: User, least recently used first
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute('CREATE TABLE IF NOT EXISTS users ('
+                                 'username TEXT PRIMARY KEY, password_hash BLOB NOT NULL) WITHOUT ROWID')
+
+    def get(self, username, default=None):
+        with self._lock:
+            user = self._cache.get(username)
+            if user is not None:
+                self._cache.move_to_end(username)
+                return user
+            row = self._connection.execute('SELECT password_hash FROM users WHERE username = ?',
+                                           (username,)).fetchone()
+            if row is None:
+                return default
+            user = self.user_class(username, bytes(row[0]))
+            self._remember(user)
+            return user
+
+    def __getitem__(self, username):
+        user = self.get(username)
+        if user is None:
+            raise KeyError(username)
+        return user
+
+    def __contains__(self, username):
+        with self._lock:
+            if username in self._cache:
+                return True
+            return self._connection.execute('SELECT 1 FROM users WHERE username = ?',
+                                            (username,)).fetchone() is not None
+
+    def __setitem__(self, username, user):
+        with self._lock:
+            try:
+                self._connection.execute('INSERT INTO users (username, password_hash) VALUES (?, ?)',
+                                         (username, user.password_hash))
+            except sqlite3.IntegrityError:
+                raise UserAlreadyExistsError(f"Username '{username}' already exists") from None
+            self._remember(user)
+
+    # Adds many users in a single transaction. users is a dict (or iterable of pairs) of username -> User. Nothing is
+    # added if any of the usernames is already stored.
+    def update(self, users):
+        items = list(users.items() if hasattr(users, 'items') else users)
+        with self._lock:
+            self._connection.execute('BEGIN')
+            try:
+                self._connection.executemany('INSERT INTO users (username, password_hash) VALUES (?, ?)',
+                                             [(username, user.password_hash) for username, user in items])
+                self._connection.execute('COMMIT')
+            except sqlite3.IntegrityError:
+                self._connection.execute('ROLLBACK')
+                raise UserAlreadyExistsError("One or more of the usernames already exist") from None
+            except BaseException:
+                self._connection.execute('ROLLBACK')
+                raise
+            for _, user in items:
+                self._remember(user)
+
+    def __delitem__(self, username):
+        with self._lock:
+            cursor = self._connection.execute('DELETE FROM users WHERE username = ?', (username,))
+            self._cache.pop(username, None)
+            if cursor.rowcount == 0:
+                raise KeyError(username)
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+
+    # Iterates over usernames, reading them from disk in batches
+    def __iter__(self):
+        for username, _ in self._rows():
+            yield username
+
+    # Iterates over every user. Users not already cached are built for the iteration only and not cached.
+    def values(self):
+        for username, password_hash in self._rows():
+            user = self._cache.get(username)
+            yield user if user is not None else self.user_class(username, password_hash)
+
+    def items(self):
+        for user in self.values():
+            yield user.username, user
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def _rows(self, batch_size=10000):
+        query = 'SELECT username, password_hash FROM users ORDER BY username LIMIT ?'
+        parameters = (batch_size,)
+        while True:
+            with self._lock:
+                rows = self._connection.execute(query, parameters).fetchall()
+            if not rows:
+                return
+            for username, password_hash in rows:
+                yield username, bytes(password_hash)
+            # Carry on after the last username seen (keyset pagination, so each batch is an index range scan)
+            query = 'SELECT username, password_hash FROM users WHERE username > ? ORDER BY username LIMIT ?'
+            parameters = (rows[-1][0], batch_size)
+
+    def _remember(self, user):
+        self._cache[user.username] = user
+        self._cache.move_to_end(user.username)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
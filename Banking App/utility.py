@@ -1,3 +1,4 @@
+from decimal import Decimal, ROUND_HALF_EVEN
 import bcrypt
 
 class UserAlreadyExistsError(ValueError):
@@ -25,6 +26,42 @@ class UnauthorizedError(PermissionError):
     pass
 
 
+# bcrypt work factor (log2 of the number of rounds) used when none is given
+DEFAULT_BCRYPT_ROUNDS = 12
+
+
 # Helper function to hash password
-def hash_password(password):
-    return bcrypt.hashpw(password.encode(), bcrypt.gensalt())
+def hash_password(password, rounds=DEFAULT_BCRYPT_ROUNDS):
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds))
+
+
+# Helper function to check a password against a stored hash
+def check_password(password, password_hash):
+    return bcrypt.checkpw(password.encode(), password_hash)
+
+
+# Minor units (e.g. cents) in one major unit, used by the integer money mode
+MINOR_UNITS_PER_MAJOR = 100
+
+
+# Helper function to convert a major unit amount (e.g. 12.34 or "12.34") to whole minor units, rounding half to even
+def to_minor_units(amount):
+    return int((Decimal(str(amount)) * MINOR_UNITS_PER_MAJOR).to_integral_value(ROUND_HALF_EVEN))
+
+
+# Helper function to format whole minor units as a major unit amount with 2 d.p., e.g. -1205 -> "-12.05"
+def format_minor_units(minor_units):
+    sign = "-" if minor_units < 0 else ""
+    major, minor = divmod(abs(minor_units), MINOR_UNITS_PER_MAJOR)
+    return f"{sign}{major}.{minor:02d}"
+
+
+# Helper function to apply a percentage rate to whole minor units, rounding the result half to even
+def percent_of_minor_units(minor_units, rate):
+    return int((Decimal(minor_units) * Decimal(str(rate)) / 100).to_integral_value(ROUND_HALF_EVEN))
+
+
+# Helper function giving the order in which accounts are locked together. Ids may be UUIDs or text (accounts rebuilt
+# from older exports), so they are compared as text; for UUIDs this is the same order as their integer value.
+def lock_order(account):
+    return str(account.id)
@@ -0,0 +1,223 @@
+import argparse
+import csv
+import os
+
+import numpy as np
+
+import config
+from model import OUTCOMES
+
+MISSING = -1  # Stored for None (a step the participant did not reach) in every column
+CHUNK_BYTES = 1 << 22  # Bytes of the results file parsed at a time
+AGE_BANDS = [18, 25, 35, 45, 55, 65]  # Lower bound of each age band
+RESULTS = ['Blue', 'Red']  # Result codes: 0 = Blue (win), 1 = Red
+
+# Column name -> NumPy dtype of the typed columns, in config.RESULTS_FIELDS order. gender and education are stored as
+# codes into the lists of a categories dict (see new_categories).
+DTYPES = {'age': np.int16, 'gender': np.int8, 'education': np.int8, 'urn_size': np.int16,
+          'unknown_urn_pos': np.int8, 'choice': np.int8, 'result': np.int8}
+NUMBERS = ['age', 'urn_size', 'unknown_urn_pos', 'choice']  # Columns stored as the number itself, not a category code
+
+# UNKNOWN_CHOSEN[choice, unknown_urn_pos] says whether the unknown urn was chosen (model.OUTCOMES as a lookup table)
+UNKNOWN_CHOSEN = np.zeros((2, 2), dtype=bool)
+for (choice, position), unknown in OUTCOMES.items():
+    UNKNOWN_CHOSEN[choice, position] = unknown
+
+
+# Labels of the gender and education codes. Values not in config are added as they are met.
+def new_categories():
+    return {'gender': list(config.GENDER_OPTIONS), 'education': list(config.EDUCATION_OPTIONS)}
+
+
+# Codes of a column of strings: labels index for categories, an int for numbers, MISSING for None
+def _codes(values, labels=None):
+    if labels is None:
+        mapping = {}
+    else:
+        mapping = {label: code for code, label in enumerate(labels)}
+    mapping['None'] = mapping[''] = MISSING
+    codes = []
+    for value in values:
+        code = mapping.get(value)
+        if code is None:
+            if labels is None:
+                code = int(value)
+            else:
+                code = len(labels)
+                labels.append(value)
+            mapping[value] = code
+        codes.append(code)
+    return codes
+
+
+# Whether a row has one value per field and a number (or None) that fits its column in every number column
+def _valid_row(row):
+    if len(row) != len(config.RESULTS_FIELDS):
+        return False
+    for field, value in zip(config.RESULTS_FIELDS, row):
+        if field in NUMBERS and value not in ('None', ''):
+            try:
+                number = int(value)
+            except ValueError:
+                return False
+            limits = np.iinfo(DTYPES[field])
+            if not limits.min <= number <= limits.max:
+                return False
+    return True
+
+
+# Parses rows of the results file (lists of strings) into a dict of typed NumPy columns
+def parse_rows(rows, categories):
+    rows = [row for row in rows if _valid_row(row)]  # Drops blank or damaged lines
+    if not rows:
+        return {field: np.zeros(0, dtype=dtype) for field, dtype in DTYPES.items()}
+    ages, genders, educations, urn_sizes, unknown_urn_positions, choices, results = zip(*rows)
+    columns = {
+        'age': _codes(ages),
+        'gender': _codes(genders, categories['gender']),
+        'education': _codes(educations, categories['education']),
+        'urn_size': _codes(urn_sizes),
+        'unknown_urn_pos': _codes(unknown_urn_positions),
+        'choice': _codes(choices),
+        'result': _codes(results, list(RESULTS)),
+    }
+    return {field: np.array(values, dtype=DTYPES[field]) for field, values in columns.items()}
+
+
+# Yields (columns, end offset) for the complete lines of the results file from byte offset on, about chunk_bytes at a
+# time. Reads both the old ", " separated lines and the CSV written by results.ResultsWriter.
+def read_chunks(filename=config.RESULTS_FILE, offset=0, chunk_bytes=CHUNK_BYTES, categories=None):
+    if categories is None:
+        categories = new_categories()
+    with open(filename, 'rb') as file:
+        file.seek(offset)
+        leftover = b''
+        while True:
+            block = file.read(chunk_bytes)
+            if not block:
+                return
+            block = leftover + block
+            end = block.rfind(b'\n') + 1  # Only whole lines; a line still being written is left for later
+            leftover = block[end:]
+            if end == 0:
+                continue
+            offset += end
+            lines = block[:end].decode('utf-8', errors='replace').splitlines()  # Damaged bytes must not stop the file being read
+            yield parse_rows(csv.reader(lines, skipinitialspace=True), categories), offset
+
+
+# Loads the whole results file into one dict of typed columns. Returns (columns, categories).
+def load_results(filename=config.RESULTS_FILE, chunk_bytes=CHUNK_BYTES):
+    categories = new_categories()
+    chunks = [columns for columns, _ in read_chunks(filename, 0, chunk_bytes, categories)]
+    if not chunks:
+        return {field: np.zeros(0, dtype=dtype) for field, dtype in DTYPES.items()}, categories
+    return {field: np.concatenate([chunk[field] for chunk in chunks]) for field in DTYPES}, categories
+
+
+class ResultsAnalysis:
+    """
+        Running totals over the results file, grouped by urn size, gender, education and age band: sessions, completed
+        sessions (a choice was made), ambiguity-averse choices (the known urn was picked) and wins.
+
+        update() only parses what has been appended to the file since the last call, so keeping a dashboard current
+        costs time in proportion to the new sessions, not the size of the file. Rows that never reach the file can be
+        counted with add_columns.
+    """
+    DIMENSIONS = ['urn_size', 'gender', 'education', 'age_band']
+
+    def __init__(self, filename=config.RESULTS_FILE, chunk_bytes=CHUNK_BYTES):
+        self.filename = filename
+        self.chunk_bytes = chunk_bytes
+        self.reset()
+
+    def reset(self):
+        self.offset = 0  # Bytes of the file already counted
+        self.categories = new_categories()
+        self.sessions = 0
+        # Key: dimension, Value: dict of group label -> [sessions, completed, averse, wins]
+        self.groups = {dimension: {} for dimension in ResultsAnalysis.DIMENSIONS}
+
+    # Counts the rows appended to the file since the last update. Returns the number of new rows.
+    def update(self):
+        if not os.path.exists(self.filename):
+            return 0
+        if os.path.getsize(self.filename) < self.offset:  # File was replaced or truncated, so start again
+            self.reset()
+        added = 0
+        for columns, offset in read_chunks(self.filename, self.offset, self.chunk_bytes, self.categories):
+            added += self.add_columns(columns)
+            self.offset = offset
+        return added
+
+    def add_columns(self, columns):
+        count = len(columns['age'])
+        if count == 0:
+            return 0
+        choice = columns['choice'].astype(np.int64)
+        position = columns['unknown_urn_pos'].astype(np.int64)
+        completed = (choice != MISSING) & (position != MISSING)
+        averse = completed & ~UNKNOWN_CHOSEN[np.where(completed, choice, 0), np.where(completed, position, 0)]
+        wins = completed & (columns['result'] == 0)
+
+        ages = columns['age']
+        age_bands = np.where(ages >= AGE_BANDS[0], np.searchsorted(AGE_BANDS, ages, side='right') - 1, MISSING)
+        keys = {'urn_size': columns['urn_size'], 'gender': columns['gender'], 'education': columns['education'],
+                'age_band': age_bands}
+        for dimension, codes in keys.items():
+            values, inverse = np.unique(codes, return_inverse=True)
+            counts = np.stack([np.bincount(inverse, minlength=len(values)),
+                               np.bincount(inverse, completed, len(values)),
+                               np.bincount(inverse, averse, len(values)),
+                               np.bincount(inverse, wins, len(values))], axis=1).astype(np.int64)
+            groups = self.groups[dimension]
+            for value, row in zip(values.tolist(), counts.tolist()):
+                label = self.label(dimension, value)
+                totals = groups.setdefault(label, [0, 0, 0, 0])
+                for i in range(4):
+                    totals[i] += row[i]
+        self.sessions += count
+        return count
+
+    def label(self, dimension, code):
+        if code == MISSING:
+            return 'None'
+        if dimension in self.categories:
+            return self.categories[dimension][code]
+        if dimension == 'age_band':
+            if code == len(AGE_BANDS) - 1:
+                return f'{AGE_BANDS[code]}+'
+            return f'{AGE_BANDS[code]}-{AGE_BANDS[code + 1] - 1}'
+        return code
+
+    # Per group of dimension: sessions, completed sessions, ambiguity-aversion rate and win rate (of completed sessions)
+    def summary(self, dimension='urn_size'):
+        summary = {}
+        for label, (sessions, completed, averse, wins) in self.groups[dimension].items():
+            summary[label] = {
+                'sessions': sessions,
+                'completed': completed,
+                'aversion_rate': averse / completed if completed else None,
+                'win_rate': wins / completed if completed else None,
+            }
+        return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Summarise the results file.")
+    parser.add_argument('filename', nargs='?', default=config.RESULTS_FILE)
+    args = parser.parse_args(argv)
+
+    analysis = ResultsAnalysis(args.filename)
+    analysis.update()
+    print(f'{analysis.sessions} sessions')
+    for dimension in ResultsAnalysis.DIMENSIONS:
+        print(f'\n{dimension:<12}  Sessions  Completed  Aversion  Win rate')
+        for label, result in sorted(analysis.summary(dimension).items(), key=lambda item: str(item[0])):
+            aversion = '-' if result['aversion_rate'] is None else f"{result['aversion_rate']:.3f}"
+            win_rate = '-' if result['win_rate'] is None else f"{result['win_rate']:.3f}"
+            print(f"{str(label):<12}  {result['sessions']:>8}  {result['completed']:>9}  {aversion:>8}  {win_rate:>8}")
+
+
+if __name__ == '__main__':
+    main()
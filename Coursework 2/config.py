@@ -10,3 +10,9 @@ EDUCATION_OPTIONS = ['High School', 'College', 'Bachelor', 'Master', 'Ph.D.']
 FINAL_MSG_FILE = 'data/final_message.txt'
 
 URN_HEADER_TEXT_FILE = 'data/urn_dialog_header.txt'
+
+KNOWN_URN_IMAGE = 'images/known_{size}.png'
+UNKNOWN_URN_IMAGE = 'images/unknown_{size}.png'
+
+RESULTS_FILE = 'data/results.csv'
+RESULTS_FIELDS = ['age', 'gender', 'education', 'urn_size', 'unknown_urn_pos', 'choice', 'result']
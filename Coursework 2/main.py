@@ -1,7 +1,15 @@
 import sys
+import time
 import config
 from model import User, Urn
 from views import *
+from resources import cache
+from results import ResultsWriter
+from PyQt5.QtCore import QTimer
+from PyQt5.QtGui import QKeySequence
+from PyQt5.QtWidgets import QShortcut
+
+KIOSK_STOP = 2  # Result of the consent dialog when staff press Ctrl+Q to close the kiosk
 
 
 def show_consent_dialog(user):
@@ -19,6 +27,14 @@ def show_urn_dialog(user):
     urn_dialog.exec_()
 
 
+# Runs a dialog and returns its result and the seconds from since until it was showing and handling events
+def show_dialog_timed(dialog, since):
+    shown = []
+    QTimer.singleShot(0, lambda: shown.append(time.perf_counter()))  # Fires once the dialog's event loop is running
+    result = dialog.exec_()
+    return result, (shown[0] if shown else time.perf_counter()) - since
+
+
 def start_experiment():
     """
         This function initialises and starts the experiment.
@@ -28,6 +44,7 @@ def start_experiment():
         is saved in a .csv file.
     """
     app = QApplication([])
+    cache.preload(background=True)  # Texts and images are read while the participant reads the consent form
 
     user = User()
 
@@ -37,4 +54,58 @@ def start_experiment():
             user.save_to_file()
 
 
-start_experiment()
+def start_kiosk(participants=None):
+    """
+        Runs the experiment for one participant after another in the same process (kiosk mode).
+
+        The QApplication, the resources and the consent, demographic and urn dialogs are created once and the dialogs
+        are reset for each new participant. Results go through one shared ResultsWriter. After each participant the
+        screen transition latencies are printed: from the end of the previous participant to the consent form, and
+        from each screen to the next. Stops after participants participants, or when staff press Ctrl+Q on the consent
+        form.
+    """
+    app = QApplication([])
+    cache.preload()
+
+    user = User()
+    consent_dialog = ConsentDialog(user)
+    demographic_dialog = DemographicDialog(user)
+    urn_dialog = UrnDialog(user)
+    QShortcut(QKeySequence('Ctrl+Q'), consent_dialog, activated=lambda: consent_dialog.done(KIOSK_STOP))
+
+    latencies = {}  # Key: screen, Value: list of transition times in seconds
+    count = 0
+    with ResultsWriter(batch_size=10, flush_interval=5.0) as writer:
+        while participants is None or count < participants:
+            started = time.perf_counter()
+            if count > 0:
+                user = User()
+                consent_dialog.reset(user)
+                demographic_dialog.reset(user)
+                urn_dialog.reset(user)
+
+            result, consent_latency = show_dialog_timed(consent_dialog, started)
+            if result == KIOSK_STOP:
+                break
+            count += 1
+            transitions = {'consent': consent_latency}
+            if result == QDialog.Accepted:
+                result, transitions['demographic'] = show_dialog_timed(demographic_dialog, time.perf_counter())
+                if result == QDialog.Accepted:
+                    _, transitions['urn'] = show_dialog_timed(urn_dialog, time.perf_counter())
+                    user.save_to_file(writer=writer)
+
+            print(f'Participant {count}: ' + ', '.join(f'{screen} {seconds * 1000:.1f} ms'
+                                                       for screen, seconds in transitions.items()))
+            for screen, seconds in transitions.items():
+                latencies.setdefault(screen, []).append(seconds)
+
+    for screen, times in latencies.items():
+        print(f'{screen}: mean {sum(times) / len(times) * 1000:.1f} ms, max {max(times) * 1000:.1f} ms '
+              f'over {len(times)} participants')
+
+
+if '--kiosk' in sys.argv:  # python main.py --kiosk
+    start_kiosk()
+else:
+    start_experiment()
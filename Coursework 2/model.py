@@ -1,5 +1,15 @@
 import random
+import numpy as np
 import config
+from results import ResultsWriter
+
+default_rng = np.random.default_rng()  # Used by draw_many when no generator is given
+
+# 0 = urn on right, 1 = left urn. (For user.choice)
+# 0 means unknown/random urn on the right, 1 = unknown urn on left (For user.unknown_urn_pos)
+# Using dictionary to map the combinations of outcome where each key is the combined outcome for user choice and unknown urn pos.
+# E.g., (0, 1) -> Chose urn on right whilst unknown urn on left so user chose known urn thereby unknown is set to False.
+OUTCOMES = {(1, 0): False, (1, 1): True, (0, 0): True, (0, 1): False}
 
 
 class Urn:
@@ -27,15 +37,31 @@ class Urn:
 
     def draw(self):
         if self.unknown:
-            balls = ['Red'] * self.red_size + ['Blue'] * (self.size - self.red_size)
-            random.shuffle(balls)
-            return random.choice(balls)
+            # Picks one of the size balls by number; numbers below red_size are the red balls, so P(Red) = red_size/size
+            if random.randrange(self.size) < self.red_size:
+                return 'Red'
+            else:
+                return 'Blue'
         else:  # If known, then 50:50
             if random.uniform(0, 1) < 0.5:  # Generates a float between 0 and 1. If number is less than 0.5 draw red, if more draw blue.
                 return 'Red'
             else:
                 return 'Blue'
 
+    # Draws n balls (with replacement, like n calls to draw) and returns them as a NumPy array of 'Red'/'Blue'.
+    # rng is an optional numpy Generator, e.g. a seeded one for reproducible simulations.
+    def draw_many(self, n, rng=None):
+        return np.where(self.draw_red_many(n, rng), 'Red', 'Blue')
+
+    # Same as draw_many but as a boolean array (True for Red), which is smaller and faster to count
+    def draw_red_many(self, n, rng=None):
+        if rng is None:
+            rng = default_rng
+        if self.unknown:
+            return rng.integers(0, self.size, n) < self.red_size
+        else:
+            return rng.random(n) < 0.5
+
 
 class User:
     def __init__(self):
@@ -92,13 +118,26 @@ class User:
     def set_choice(self, choice):
         self.choice = choice
 
+    # Sets the urn to the one the user chose, draws a ball from it and stores it as the result
+    def draw_ball(self):
+        self.urn.set_unknown(OUTCOMES[(self.choice, self.unknown_urn_pos)])
+        self.result = self.urn.draw()  # Calls draw method to randomly pick a ball
+        return self.result
+
     def describe(self):
         return f"User: [Accept Consent: {self.accept_consent}, Age: {self.age}, Education: {self.education}, " \
                f"Gender: {self.gender}, Urn Size: {self.urn_size}, Choice: {self.choice}]"
 
-    def save_to_file(self, filename='data/results.csv'):
-        file = open(filename, 'a')
-        line = (f'{self.age}, {self.gender}, {self.get_education()}, '
-                f'{self.urn_size}, {self.unknown_urn_pos}, {self.choice}, {self.result}')
-        file.write(f"{line}\n")
-        file.close()
+    # Values saved to the results file, in the order of config.RESULTS_FIELDS
+    def to_row(self):
+        return [self.age, self.gender, self.get_education(), self.urn_size, self.unknown_urn_pos, self.choice,
+                self.result]
+
+    # Appends the user's results through writer (a results.ResultsWriter shared between participants), or straight to
+    # filename if no writer is given
+    def save_to_file(self, filename=config.RESULTS_FILE, writer=None):
+        if writer is not None:
+            writer.write(self)
+        else:
+            with ResultsWriter(filename, batch_size=1) as writer:
+                writer.write(self)
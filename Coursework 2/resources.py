@@ -0,0 +1,104 @@
+import os
+import threading
+
+from PyQt5.QtGui import QImage, QPixmap
+
+import config
+from utility import read_file
+
+
+# Text files and image paths every participant sees
+def default_text_files():
+    return [config.CONSENT_FILE, config.FINAL_MSG_FILE, config.URN_HEADER_TEXT_FILE]
+
+
+def default_image_files():
+    return [image.format(size=size) for size in config.URN_SIZES
+            for image in (config.KNOWN_URN_IMAGE, config.UNKNOWN_URN_IMAGE)]
+
+
+# Modification time and size of a file, used to notice when it has changed
+def _version(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+class ResourceCache:
+    """
+        Keeps the dialog texts and decoded urn images in memory so screens open without reading or decoding files.
+
+        Each lookup checks the file's modification time and size and reloads it if it has changed, so edited texts or
+        images are picked up without restarting. preload() loads the default resources up front, optionally in a
+        background thread. Images are decoded to QImage there (safe outside the GUI thread) and turned into a QPixmap
+        the first time the GUI asks for them.
+    """
+    def __init__(self):
+        self.texts = {}  # Key: path, Value: (version, text)
+        self.images = {}  # Key: path, Value: (version, QImage)
+        self.pixmaps = {}  # Key: path, Value: (version, QPixmap), only touched from the GUI thread
+        self.lock = threading.Lock()
+        self.preload_thread = None
+
+    def text(self, path):
+        version = _version(path)
+        with self.lock:
+            cached = self.texts.get(path)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        text = read_file(path)
+        with self.lock:
+            self.texts[path] = (version, text)
+        return text
+
+    def image(self, path):
+        version = _version(path)
+        with self.lock:
+            cached = self.images.get(path)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        image = QImage(path)
+        with self.lock:
+            self.images[path] = (version, image)
+        return image
+
+    # Must be called from the GUI thread, like any QPixmap use
+    def pixmap(self, path):
+        version = _version(path)
+        cached = self.pixmaps.get(path)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        pixmap = QPixmap.fromImage(self.image(path))
+        self.pixmaps[path] = (version, pixmap)
+        return pixmap
+
+    # Loads the given (or default) texts and images. With background=True this happens in a daemon thread and the
+    # call returns straight away; lookups made before it finishes just load the file themselves.
+    def preload(self, text_files=None, image_files=None, background=False):
+        text_files = default_text_files() if text_files is None else text_files
+        image_files = default_image_files() if image_files is None else image_files
+        if background:
+            self.preload_thread = threading.Thread(target=self.load_all, args=(text_files, image_files), daemon=True)
+            self.preload_thread.start()
+        else:
+            self.load_all(text_files, image_files)
+
+    def load_all(self, text_files, image_files):
+        for path in text_files:
+            try:
+                self.text(path)
+            except OSError:  # Left for the dialog to report when it needs the file
+                pass
+        for path in image_files:
+            try:
+                self.image(path)
+            except OSError:
+                pass
+
+    def clear(self):
+        with self.lock:
+            self.texts.clear()
+            self.images.clear()
+        self.pixmaps.clear()
+
+
+cache = ResourceCache()  # Shared by the views
@@ -0,0 +1,108 @@
+import csv
+import io
+import os
+import threading
+
+import config
+
+try:  # File locking: fcntl on Linux/macOS, msvcrt on Windows
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+def _lock_file(fd):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_LOCK, 1)  # Locks the first byte, which every writer agrees on
+
+
+def _unlock_file(fd):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+# Writes values the way the results file always has, with None for steps a participant did not reach
+def _format_value(value):
+    return 'None' if value is None else value
+
+
+class ResultsWriter:
+    """
+        Appends participant results to the results file (config.RESULTS_FILE) as properly quoted CSV rows, in the
+        column order of config.RESULTS_FIELDS.
+
+        Rows are buffered and written in batches: the buffer is flushed once it holds batch_size rows, or flush_interval
+        seconds after the first row went into it (None to only flush on batch_size, flush() and close()). Each flush
+        appends the whole batch with a single write while holding an exclusive lock on the file, so several threads or
+        kiosk processes can share one results file without their lines interleaving. With fsync=True every flush is
+        also forced to disk before it returns.
+    """
+    def __init__(self, filename=config.RESULTS_FILE, batch_size=100, flush_interval=5.0, fsync=False):
+        self.filename = filename
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.rows = []  # Buffered rows not yet written
+        self.rows_written = 0
+        self.lock = threading.Lock()
+        self.timer = None  # Flushes the buffer flush_interval seconds after its first row
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, user):
+        self.write_row(user.to_row())
+
+    def write_row(self, row):
+        with self.lock:
+            self.rows.append([_format_value(value) for value in row])
+            if len(self.rows) >= self.batch_size:
+                self.flush_locked()
+            elif len(self.rows) == 1 and self.flush_interval is not None:
+                self.timer = threading.Timer(self.flush_interval, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self):
+        with self.lock:
+            self.flush_locked()
+
+    def flush_locked(self):  # Must be called with self.lock held
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if not self.rows:
+            return
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator='\n').writerows(self.rows)
+        data = buffer.getvalue().encode('utf-8')
+
+        fd = os.open(self.filename, os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o644)
+        try:
+            _lock_file(fd)
+            try:
+                written = 0
+                while written < len(data):  # os.write may write less than asked for
+                    written += os.write(fd, data[written:])
+                if self.fsync:
+                    os.fsync(fd)
+            finally:
+                _unlock_file(fd)
+        finally:
+            os.close(fd)
+        self.rows_written += len(self.rows)
+        self.rows = []
+
+    def close(self):
+        self.flush()
+
@@ -0,0 +1,174 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import numpy as np
+
+import config
+from model import OUTCOMES
+
+DEFAULT_CHUNK_SIZE = 1000000  # Participants simulated per task (and per random stream)
+COUNTS = ['participants', 'unknown_left', 'chose_unknown', 'wins', 'wins_unknown']  # Per urn size
+
+# OUTCOMES as lookup tables: UNKNOWN_CHOSEN[choice, unknown_urn_pos] says whether the unknown urn was chosen, and
+# CHOICE_FOR[chose_unknown, unknown_urn_pos] gives the choice that picks that urn
+UNKNOWN_CHOSEN = np.zeros((2, 2), dtype=bool)
+CHOICE_FOR = np.zeros((2, 2), dtype=np.int64)
+for (choice, position), unknown in OUTCOMES.items():
+    UNKNOWN_CHOSEN[choice, position] = unknown
+    CHOICE_FOR[int(unknown), position] = choice
+
+
+# Choice policies: each takes a numpy Generator and the participants' urn sizes and unknown urn positions and returns
+# their choices (1 = left urn, 0 = right urn, like user.choice)
+def random_policy(rng, urn_sizes, unknown_positions):
+    return rng.integers(0, 2, len(urn_sizes))
+
+
+def left_policy(rng, urn_sizes, unknown_positions):
+    return np.ones(len(urn_sizes), dtype=np.int64)
+
+
+def averse_policy(rng, urn_sizes, unknown_positions):  # Always picks the known 50:50 urn
+    return CHOICE_FOR[0, unknown_positions]
+
+
+def seeking_policy(rng, urn_sizes, unknown_positions):  # Always picks the unknown urn
+    return CHOICE_FOR[1, unknown_positions]
+
+
+# Picks the unknown urn with probability rate, which is a float or a dict of urn size -> probability
+def unknown_rate_policy(rate, rng, urn_sizes, unknown_positions):
+    if isinstance(rate, dict):  # Urn sizes missing from the dict get 0.5
+        rates = np.full(len(urn_sizes), 0.5)
+        for size, size_rate in rate.items():
+            rates[urn_sizes == size] = size_rate
+        rate = rates
+    chose_unknown = rng.random(len(urn_sizes)) < rate
+    return CHOICE_FOR[chose_unknown.astype(np.int64), unknown_positions]
+
+
+POLICIES = {'random': random_policy, 'left': left_policy, 'averse': averse_policy, 'seeking': seeking_policy}
+
+
+# Turns a policy name, an unknown urn probability (float or dict per urn size) or a function into a policy function.
+# Functions must be defined at module level so they can be sent to the worker processes.
+def get_policy(policy):
+    if callable(policy):
+        return policy
+    if isinstance(policy, str):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown policy '{policy}', choose from {', '.join(POLICIES)} or a probability")
+        return POLICIES[policy]
+    return partial(unknown_rate_policy, policy)
+
+
+# Simulates count participants the way model.User, the urn dialog and Urn.draw do, all at once with NumPy, and
+# returns their counts per urn size (in config.URN_SIZES order)
+def simulate_chunk(count, seed, policy):
+    rng = np.random.default_rng(seed)
+    sizes = np.array(config.URN_SIZES)
+    size_index = rng.integers(0, len(sizes), count)  # random.choice(config.URN_SIZES)
+    urn_sizes = sizes[size_index]
+    unknown_positions = np.array(config.URN_POSITIONS)[rng.integers(0, len(config.URN_POSITIONS), count)]
+    red_sizes = rng.integers(0, urn_sizes + 1)  # Urn.red_size, random.randint(0, size)
+
+    choices = policy(rng, urn_sizes, unknown_positions)
+    unknown = UNKNOWN_CHOSEN[choices, unknown_positions]
+    # Urn.draw: red with probability red_size/size from the unknown urn, 50:50 from the known one
+    red = np.where(unknown, rng.integers(0, urn_sizes) < red_sizes, rng.random(count) < 0.5)
+    wins = ~red  # Blue wins
+
+    def per_size(weights=None):
+        return np.bincount(size_index, weights, minlength=len(sizes)).astype(np.int64)
+
+    return {
+        'participants': per_size(),
+        'unknown_left': per_size(unknown_positions == 1),
+        'chose_unknown': per_size(unknown),
+        'wins': per_size(wins),
+        'wins_unknown': per_size(wins & unknown),
+    }
+
+
+def _rate(numerator, denominator):
+    return numerator / denominator if denominator else None
+
+
+# Runs participants synthetic participants under policy across workers processes and reports, per urn size, the
+# condition balance (share of participants and share with the unknown urn on the left), how often the unknown urn
+# was chosen and the win rates. The participants are split into chunks of chunk_size, each with its own random stream
+# spawned from seed, so a seeded run gives the same results whatever the number of workers.
+def simulate(participants, policy='random', workers=None, seed=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    policy_function = get_policy(policy)
+    seed_sequence = np.random.SeedSequence(seed)
+    counts = [min(chunk_size, participants - first) for first in range(0, participants, chunk_size)]
+    seeds = seed_sequence.spawn(len(counts))
+    workers = workers or os.cpu_count() or 1
+
+    started = time.perf_counter()
+    if workers == 1 or len(counts) == 1:
+        totals = _sum_results(map(simulate_chunk, counts, seeds, [policy_function] * len(counts)))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            totals = _sum_results(executor.map(simulate_chunk, counts, seeds, [policy_function] * len(counts)))
+    seconds = time.perf_counter() - started
+
+    urn_sizes = {}
+    for i, size in enumerate(config.URN_SIZES):
+        total = int(totals['participants'][i])
+        chose_unknown = int(totals['chose_unknown'][i])
+        wins = int(totals['wins'][i])
+        wins_unknown = int(totals['wins_unknown'][i])
+        urn_sizes[size] = {
+            'participants': total,
+            'share': _rate(total, participants),
+            'unknown_left_share': _rate(int(totals['unknown_left'][i]), total),
+            'chose_unknown_rate': _rate(chose_unknown, total),
+            'win_rate': _rate(wins, total),
+            'win_rate_unknown': _rate(wins_unknown, chose_unknown),
+            'win_rate_known': _rate(wins - wins_unknown, total - chose_unknown),
+        }
+    return {'participants': participants, 'policy': policy, 'seed': seed_sequence.entropy, 'workers': workers,
+            'seconds': seconds, 'urn_sizes': urn_sizes}
+
+
+def _sum_results(results):
+    totals = {key: np.zeros(len(config.URN_SIZES), dtype=np.int64) for key in COUNTS}
+    for result in results:
+        for key in COUNTS:
+            totals[key] += result[key]
+    return totals
+
+
+def _format_rate(rate):
+    return '-' if rate is None else f'{rate:.4f}'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate the urn experiment without the GUI.")
+    parser.add_argument('--participants', type=int, default=1000000, help="number of synthetic participants")
+    parser.add_argument('--policy', default='random',
+                        help=f"choice policy: {', '.join(POLICIES)}, or the probability of picking the unknown urn")
+    parser.add_argument('--workers', type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument('--seed', type=int, help="seed for reproducible runs (printed when not given)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help="participants per task")
+    args = parser.parse_args(argv)
+
+    policy = args.policy if args.policy in POLICIES else float(args.policy)
+    summary = simulate(args.participants, policy, args.workers, args.seed, args.chunk_size)
+
+    print(f"{summary['participants']} participants, policy {summary['policy']}, seed {summary['seed']}, "
+          f"{summary['workers']} workers, {summary['seconds']:.2f}s")
+    print('Urn size  Participants  Share   Unknown left  Chose unknown  Win rate  Win (unknown)  Win (known)')
+    for size, result in summary['urn_sizes'].items():
+        print(f"{size:>8}  {result['participants']:>12}  {_format_rate(result['share'])}  "
+              f"{_format_rate(result['unknown_left_share']):>12}  {_format_rate(result['chose_unknown_rate']):>13}  "
+              f"{_format_rate(result['win_rate']):>8}  {_format_rate(result['win_rate_unknown']):>13}  "
+              f"{_format_rate(result['win_rate_known']):>11}")
+
+
+if __name__ == '__main__':
+    main()
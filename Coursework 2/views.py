@@ -6,7 +6,8 @@ from PyQt5.QtGui import QPixmap, QFont
 from PyQt5.QtCore import Qt, QSize
 import config
 from model import User, Urn
-from utility import read_file, create_label, create_button, create_layout
+from utility import create_label, create_button, create_layout
+from resources import cache
 
 
 class ConsentDialog(QDialog):  # Inheriting properties from QDialog
@@ -18,13 +19,8 @@ class ConsentDialog(QDialog):  # Inheriting properties from QDialog
     def init_ui(self):  # To set up UI for Consent Form
         self.setWindowTitle('Consent Form')
 
-        # Read consent_text from file
-        consent_text = read_file(config.CONSENT_FILE)
-        if consent_text is None:
-            consent_text = "Error loading consent text."
-
         # Using create_label from utility.py
-        self.consent_label = create_label(consent_text, font_size=10)
+        self.consent_label = create_label(self.read_consent_text(), font_size=10)
 
         self.consent_checkbox = QCheckBox('I consent')
 
@@ -47,6 +43,19 @@ class ConsentDialog(QDialog):  # Inheriting properties from QDialog
 
         self.setLayout(layout)
 
+    def read_consent_text(self):
+        # Read consent_text from file
+        consent_text = cache.text(config.CONSENT_FILE)
+        if consent_text is None:
+            consent_text = "Error loading consent text."
+        return consent_text
+
+    def reset(self, user):  # Reuses the dialog for the next participant (kiosk mode)
+        self.user = user
+        self.consent_label.setText(self.read_consent_text())
+        self.consent_checkbox.setChecked(False)
+        self.accept_button.setEnabled(False)
+
     def update_accept_button_state(self):
         self.accept_button.setEnabled(self.consent_checkbox.isChecked())
 
@@ -94,6 +103,12 @@ class DemographicDialog(QDialog):  # Inheriting from QDialog
 
         self.setLayout(layout)
 
+    def reset(self, user):  # Reuses the dialog for the next participant (kiosk mode)
+        self.user = user
+        self.age_input.clear()
+        self.gender_combobox.setCurrentIndex(0)
+        self.education_combobox.setCurrentIndex(0)
+
     def submit_button_clicked(self):  # Data Verification and Error Messages
         age_text = self.age_input.text()
 
@@ -144,15 +159,7 @@ class FinalMessageDialog(QDialog):  # Inheriting from QDialog
         self.setWindowTitle('Debrief')
         self.setGeometry(200, 200, 800, 400)
 
-        # 0 = urn on right, 1 = left urn. (For user.choice)
-        # 0 means unknown/random urn on the right, 1 = unknown urn on left (For user.unknown_urn_pos)
-        # Using dictionary to map the combinations of outcome where each key is the combined outcome for user choice and unknown urn pos.
-        # E.g., (0, 1) -> Chose urn on right whilst unknown urn on left so user chose known urn thereby unknown is set to False.
-        outcomes = {(1, 0): False, (1, 1): True, (0, 0): True, (0, 1): False}
-        self.user.urn.set_unknown(outcomes[(self.user.choice, self.user.unknown_urn_pos)])
-
-        picked_ball = self.user.urn.draw()  # Calls draw method to randomly pick a ball
-        self.user.result = picked_ball
+        picked_ball = self.user.draw_ball()  # Draws from the urn the user chose (see model.OUTCOMES)
 
         if picked_ball == "Blue":
             result = "Win"
@@ -163,7 +170,7 @@ class FinalMessageDialog(QDialog):  # Inheriting from QDialog
 
         final_label = create_label(message, font_size=14)
 
-        result_message = read_file(config.FINAL_MSG_FILE)
+        result_message = cache.text(config.FINAL_MSG_FILE)
 
         result_textbox = QTextEdit()
         # Error checking
@@ -190,7 +197,7 @@ class UrnDialog(QDialog):
     def __init__(self, user):
         super().__init__()
         self.user = user
-        self.head_text = read_file(config.URN_HEADER_TEXT_FILE)
+        self.head_text = cache.text(config.URN_HEADER_TEXT_FILE)
         self.init_ui()
 
     def handle_img1_press(self, event):
@@ -202,19 +209,58 @@ class UrnDialog(QDialog):
     def init_ui(self):
         self.setWindowTitle('Urn Dialog')
         self.setGeometry(100, 100, 600, 300)
+
+        self.top_text_label = create_label('', font_size=16)
+
+        # Image 1
+        self.img1_label = QLabel(self)
+        self.img1_label.mousePressEvent = self.handle_img1_press
+
+        # Label at the bottom of Image 1
+        self.bottom_text_label1 = create_label('', font_size=12)
+        self.bottom_text_label1.setAlignment(Qt.AlignCenter)
+
+        # Image 2
+        self.img2_label = QLabel(self)
+        self.img2_label.mousePressEvent = self.handle_img2_press
+
+        # Label at the bottom of Image 2
+        self.bottom_text_label2 = create_label('', font_size=12)
+        self.bottom_text_label2.setAlignment(Qt.AlignCenter)
+
+        # Layouts
+        main_layout = create_layout()
+
+        top_layout = create_layout(orientation='vertical', widgets=[self.top_text_label])
+
+        layout = create_layout('horizontal')
+        layout.addWidget(self.img1_label, alignment=Qt.AlignCenter)
+        layout.addWidget(self.img2_label, alignment=Qt.AlignCenter)
+
+        bottom_layout = create_layout(orientation='horizontal',
+                                      widgets=[self.bottom_text_label1, self.bottom_text_label2])
+
+        main_layout.addLayout(top_layout)
+        main_layout.addLayout(layout)
+        main_layout.addLayout(bottom_layout)
+
+        self.setLayout(main_layout)
+
+        self.show_urns()
+
+    def show_urns(self):  # Fills in the header, images and labels for the current user
         # Error checking
         if self.head_text is None:
             self.head_text = "Error loading header text."
-
-        top_text_label = create_label(self.head_text, font_size=16)
+        self.top_text_label.setText(self.head_text)
 
         # Getting user's urn size and unknown urn position
         urn_size = self.user.get_urn_size()
         unknown_urn_pos = self.user.get_unknown_urn_pos()
 
         # Retrieving the images and creating labels dependent on urn size
-        known_img = f'images/known_{urn_size}.png'
-        unknown_img = f'images/unknown_{urn_size}.png'
+        known_img = config.KNOWN_URN_IMAGE.format(size=urn_size)
+        unknown_img = config.UNKNOWN_URN_IMAGE.format(size=urn_size)
         known_text = f'50 : 50 mix of {urn_size} balls'
         unknown_text = f'Unknown mix of {urn_size} balls'
 
@@ -230,45 +276,18 @@ class UrnDialog(QDialog):
             img2_name = known_img
             text_label2 = known_text
 
-        # Image 1
-        img1_label = QLabel(self)
-        img1_pixmap = QPixmap(img1_name)
-        img1_label.setPixmap(img1_pixmap)
-        img1_label.setToolTip(text_label1)
-        img1_label.mousePressEvent = self.handle_img1_press
-
-        #
-        # Label at the bottom of Image 1
-        bottom_text_label1 = create_label("Urn A: " + text_label1, font_size=12)
-        bottom_text_label1.setAlignment(Qt.AlignCenter)
-
-        # Image 2
-        img2_label = QLabel(self)
-        img2_pixmap = QPixmap(img2_name)
-        img2_label.setPixmap(img2_pixmap)
-        img2_label.setToolTip(text_label2)
-        img2_label.mousePressEvent = self.handle_img2_press
-
-        # Label at the bottom of Image 2
-        bottom_text_label2 = create_label("Urn B: " + text_label2, font_size=12)
-        bottom_text_label2.setAlignment(Qt.AlignCenter)
-
-        # Layouts
-        main_layout = create_layout()
-
-        top_layout = create_layout(orientation='vertical', widgets=[top_text_label])
-
-        layout = create_layout('horizontal')
-        layout.addWidget(img1_label, alignment=Qt.AlignCenter)
-        layout.addWidget(img2_label, alignment=Qt.AlignCenter)
+        self.img1_label.setPixmap(cache.pixmap(img1_name))  # Decoded once and kept in memory
+        self.img1_label.setToolTip(text_label1)
+        self.bottom_text_label1.setText("Urn A: " + text_label1)
 
-        bottom_layout = create_layout(orientation='horizontal', widgets=[bottom_text_label1, bottom_text_label2])
+        self.img2_label.setPixmap(cache.pixmap(img2_name))
+        self.img2_label.setToolTip(text_label2)
+        self.bottom_text_label2.setText("Urn B: " + text_label2)
 
-        main_layout.addLayout(top_layout)
-        main_layout.addLayout(layout)
-        main_layout.addLayout(bottom_layout)
-
-        self.setLayout(main_layout)
+    def reset(self, user):  # Reuses the dialog for the next participant (kiosk mode)
+        self.user = user
+        self.head_text = cache.text(config.URN_HEADER_TEXT_FILE)
+        self.show_urns()
 
     def show_final_message(self, choice=0):
         self.user.choice = choice